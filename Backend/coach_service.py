@@ -3,12 +3,23 @@ GymIntel AI Coach Service
 Text-based coaching using Gemini with function calling.
 Can be upgraded to voice (Gemini Live) later.
 """
+import concurrent.futures
 import json
+import random
+import threading
+import time
+from functools import lru_cache
 from typing import Optional, Callable, Any
-from google import genai
 from google.genai import types
 
 from config import settings
+from gemini_service import get_client, run_inline_batch
+from database import (
+    RECENT_WORKOUT_PROJECTION, get_recent_workouts, iter_recent_workouts,
+    get_muscle_activation_history, get_exercise_frequency,
+    get_form_issues_with_counts, get_exercise_stats, get_user, SEVERE_FORM_SEVERITIES
+)
+from muscle_map import analyze_muscle_balance
 
 # ============================================================
 # Coach System Prompt
@@ -129,15 +140,64 @@ COACH_TOOLS = [
 ]
 
 
+# Tool and config objects are immutable, so build them once per process
+COACH_TOOL = types.Tool(function_declarations=COACH_TOOLS)
+COACH_CONFIG = types.GenerateContentConfig(
+    system_instruction=COACH_SYSTEM_PROMPT,
+    tools=[COACH_TOOL],
+    temperature=0.7,
+)
+
+
 # ============================================================
 # Function Handlers
 # ============================================================
 
-def handle_get_recent_workouts(user_id: str, days: int = 30, limit: int = 5) -> dict:
+def _recent_workouts(user_id: str, days: int, workout_cache: Optional[dict] = None) -> list:
+    """
+    Fetch recent workouts once per (user_id, days) and reuse them.
+    Several handlers in a single coach turn need the same workouts, and they may
+    run concurrently: the cache holds a Future per key, claimed with the atomic
+    dict.setdefault, so only the first caller queries and the rest wait on it.
+    """
+    if workout_cache is None:
+        return get_recent_workouts(user_id, days, projection=RECENT_WORKOUT_PROJECTION)
+
+    key = (user_id, days)
+    future = workout_cache.get(key)
+    if future is None:
+        claimed = concurrent.futures.Future()
+        future = workout_cache.setdefault(key, claimed)
+        if future is claimed:
+            try:
+                claimed.set_result(get_recent_workouts(user_id, days, projection=RECENT_WORKOUT_PROJECTION))
+            except Exception as e:
+                claimed.set_exception(e)
+    return future.result()
+
+
+def _cached_workouts(user_id: str, days: int, workout_cache: Optional[dict] = None) -> Optional[list]:
+    """Workouts another handler already fetched (or is fetching) this turn, else None."""
+    future = workout_cache.get((user_id, days)) if workout_cache is not None else None
+    return future.result() if future is not None else None
+
+
+def handle_get_recent_workouts(
+        user_id: str,
+        days: int = 30,
+        limit: int = 5,
+        workout_cache: Optional[dict] = None
+) -> dict:
     """Get recent workouts for the user."""
     try:
-        from database import get_recent_workouts
-        workouts = get_recent_workouts(user_id, days)[:limit]
+        workouts = _cached_workouts(user_id, days, workout_cache)
+        if workouts is not None:
+            workouts = workouts[:limit]
+        else:
+            # Only `limit` documents are fetched and decoded
+            workouts = list(iter_recent_workouts(
+                user_id, days, projection=RECENT_WORKOUT_PROJECTION, limit=limit
+            ))
         return {
             "count": len(workouts),
             "workouts": [
@@ -163,13 +223,11 @@ def handle_get_recent_workouts(user_id: str, days: int = 30, limit: int = 5) ->
         return {"error": str(e), "count": 0, "workouts": []}
 
 
-def handle_get_muscle_balance(user_id: str, days: int = 30) -> dict:
+def handle_get_muscle_balance(user_id: str, days: int = 30, workout_cache: Optional[dict] = None) -> dict:
     """Get muscle balance analysis."""
     try:
-        from database import get_muscle_activation_history
-        from muscle_map import analyze_muscle_balance
-
-        history = get_muscle_activation_history(user_id, days)
+        workouts = _recent_workouts(user_id, days, workout_cache)
+        history = get_muscle_activation_history(user_id, days, workouts=workouts)
         if not history:
             return {"status": "no_data", "message": "No workout data found for analysis"}
 
@@ -179,69 +237,43 @@ def handle_get_muscle_balance(user_id: str, days: int = 30) -> dict:
         return {"error": str(e), "status": "error"}
 
 
-def handle_get_form_issues(user_id: str, exercise: str = None, days: int = 30, limit: int = 10, **kwargs) -> dict:
-    """Get form issues from recent workouts."""
+def handle_get_form_issues(
+        user_id: str,
+        exercise: str = None,
+        days: int = 30,
+        limit: int = 10,
+        workout_cache: Optional[dict] = None,
+        **kwargs
+) -> dict:
+    """Get the most recent form issues and per-severity totals."""
     try:
-        from database import get_form_issues_summary
-
-        issues = get_form_issues_summary(user_id, days)
-        if exercise:
-            issues = [i for i in issues if exercise.lower() in i.get("exercise", "").lower()]
+        # Totals and the `limit` newest issues come back from one aggregation
+        result = get_form_issues_with_counts(user_id, days, exercise, limit)
+        counts = result["counts"]
 
         return {
-            "count": len(issues),
-            "issues": issues[:limit]
+            "count": sum(n for severity, n in counts.items() if severity in SEVERE_FORM_SEVERITIES),
+            "counts": counts,
+            "issues": result["issues"]
         }
     except Exception as e:
         return {"error": str(e), "count": 0, "issues": []}
 
 
-def handle_get_exercise_stats(user_id: str, exercise: str) -> dict:
-    """Get stats for a specific exercise."""
+def handle_get_exercise_stats(user_id: str, exercise: str, workout_cache: Optional[dict] = None) -> dict:
+    """Get stats for a specific exercise (aggregated in MongoDB)."""
     try:
-        from database import get_recent_workouts
-        from collections import Counter
-
-        workouts = get_recent_workouts(user_id, 30)
-
-        stats = {
-            "exercise": exercise,
-            "times_performed": 0,
-            "total_reps": 0,
-            "total_sets": 0,
-            "common_issues": []
-        }
-
-        all_issues = []
-
-        for w in workouts:
-            for ex in w.exercises:
-                if exercise.lower() in ex.name.lower():
-                    stats["times_performed"] += 1
-                    stats["total_reps"] += ex.reps
-                    stats["total_sets"] += ex.sets
-                    for fb in ex.form_feedback:
-                        if fb.severity in ["warning", "critical"]:
-                            all_issues.append(fb.note)
-
-        # Get most common issues
-        if all_issues:
-            issue_counts = Counter(all_issues)
-            stats["common_issues"] = [issue for issue, _ in issue_counts.most_common(3)]
-
-        return stats
+        return get_exercise_stats(user_id, exercise, 30)
     except Exception as e:
         return {"error": str(e), "exercise": exercise}
 
 
-def handle_get_recommendations(user_id: str) -> dict:
+def handle_get_recommendations(user_id: str, workout_cache: Optional[dict] = None) -> dict:
     """Get exercise recommendations."""
     try:
-        from database import get_muscle_activation_history, get_exercise_frequency, get_user
-        from muscle_map import analyze_muscle_balance
-
         user = get_user(user_id)
-        history = get_muscle_activation_history(user_id, 30)
+        workouts = _recent_workouts(user_id, 30, workout_cache)
+        history = get_muscle_activation_history(user_id, 30, workouts=workouts)
 
         if not history:
             return {
@@ -253,7 +285,7 @@ def handle_get_recommendations(user_id: str) -> dict:
             }
 
         analysis = analyze_muscle_balance(history)
-        exercise_freq = get_exercise_frequency(user_id, 30)
+        exercise_freq = get_exercise_frequency(user_id, 30, workouts=workouts)
 
         recommendations = []
 
@@ -271,9 +303,14 @@ def handle_get_recommendations(user_id: str) -> dict:
 
         # Based on what they're already doing
         if exercise_freq:
-            if not any("row" in ex.lower() for ex in exercise_freq):
+            has_row = has_pull = False
+            for ex in exercise_freq:
+                name = ex.lower()
+                has_row = has_row or "row" in name
+                has_pull = has_pull or "pull" in name
+            if not has_row:
                 recommendations.append("Consider adding rowing movements for back balance")
-            if not any("pull" in ex.lower() for ex in exercise_freq):
+            if not has_pull:
                 recommendations.append("Pull-ups or lat pulldowns would complement your training")
 
         if not recommendations:
@@ -284,18 +321,28 @@ def handle_get_recommendations(user_id: str) -> dict:
         return {"error": str(e), "recommendations": []}
 
 
-def handle_compare_to_peers(user_id: str, metric: str = "form") -> dict:
-    """Compare user to peers (mock data for now - would use Snowflake in production)."""
-    # TODO: Implement actual Snowflake query
-    import random
+PEER_PERCENTILE_TTL_SEC = 3600
+
 
-    percentiles = {
-        "form": random.randint(60, 90),
-        "frequency": random.randint(40, 80),
-        "balance": random.randint(50, 85),
-        "depth": random.randint(55, 92)
+@lru_cache(maxsize=1024)
+def _peer_percentiles(user_id: str, ttl_bucket: int) -> dict[str, int]:
+    """
+    Mock peer percentiles, stable per user within a TTL bucket.
+    The bucket argument expires cache entries; the seed keeps retries consistent.
+    """
+    rng = random.Random(f"{user_id}:{ttl_bucket}")
+    return {
+        "form": rng.randint(60, 90),
+        "frequency": rng.randint(40, 80),
+        "balance": rng.randint(50, 85),
+        "depth": rng.randint(55, 92)
     }
 
+
+def handle_compare_to_peers(user_id: str, metric: str = "form", workout_cache: Optional[dict] = None) -> dict:
+    """Compare user to peers (mock data for now - would use Snowflake in production)."""
+    # TODO: Implement actual Snowflake query
+    percentiles = _peer_percentiles(user_id, int(time.time() // PEER_PERCENTILE_TTL_SEC))
     pct = percentiles.get(metric, 70)
 
     messages = {
@@ -327,14 +374,51 @@ FUNCTION_HANDLERS = {
 # Coach Service Class
 # ============================================================
 
+# Max Content entries (messages, function calls and responses) sent per turn
+MAX_HISTORY_CONTENTS = 20
+
+
+class RedisCoachHistory:
+    """Coach conversation history shared across workers via Redis (coach:{user_id})."""
+
+    TTL_SEC = 3600
+
+    def __init__(self, url: str):
+        import redis
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+
+    def _key(self, user_id: str) -> str:
+        return f"coach:{user_id}"
+
+    def load(self, user_id: str) -> Optional[list[types.Content]]:
+        data = self.redis.get(self._key(user_id))
+        if data is None:
+            return None
+        return [types.Content.model_validate(c) for c in json.loads(data)]
+
+    def save(self, user_id: str, history: list[types.Content]):
+        data = json.dumps([c.model_dump(mode="json", exclude_none=True) for c in history])
+        self.redis.setex(self._key(user_id), self.TTL_SEC, data)
+
+    def delete(self, user_id: str):
+        self.redis.delete(self._key(user_id))
+
+
 class CoachService:
     """Text-based AI coaching service using Gemini with function calling."""
 
-    def __init__(self, user_id: str):
+    def __init__(self, user_id: str, history_store: Optional[RedisCoachHistory] = None):
         self.user_id = user_id
-        self.client = genai.Client(api_key=settings.GOOGLE_API_KEY)
+        self.client = get_client()
         self.conversation_history: list[types.Content] = []
+        # Optional shared store, so any worker can continue the conversation
+        self.history_store = history_store
+        if history_store:
+            self.conversation_history = history_store.load(user_id) or []
         self.model = settings.GEMINI_ANALYSIS_MODEL  # gemini-2.0-flash
+        # Recent workouts keyed by (user_id, days), shared by handlers within one turn
+        self._workout_cache: dict[tuple[str, int], concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
 
     def _execute_function(self, function_call) -> dict:
         """Execute a function call and return the result."""
@@ -347,14 +431,30 @@ class CoachService:
         if not handler:
             return {"error": f"Unknown function: {func_name}"}
 
-        # Always pass user_id
-        return handler(self.user_id, **args)
+        # Always pass user_id and the per-turn workout cache
+        return handler(self.user_id, workout_cache=self._workout_cache, **args)
 
     def chat(self, user_message: str) -> str:
         """
         Send a message to the coach and get a response.
         Handles function calling automatically.
         """
+        # One turn at a time per coach; turns mutate the shared history
+        with self._lock:
+            if self.history_store:
+                # The store is the source of truth: another worker may have taken
+                # turns, or reset the conversation (no saved history), since this
+                # instance last did
+                self.conversation_history = self.history_store.load(self.user_id) or []
+            reply = self._chat(user_message)
+            if self.history_store:
+                self.history_store.save(self.user_id, self.conversation_history)
+            return reply
+
+    def _chat(self, user_message: str) -> str:
+        # Workouts may have changed since the last turn
+        self._workout_cache.clear()
+
         # Add user message to history
         self.conversation_history.append(
             types.Content(
@@ -363,13 +463,7 @@ class CoachService:
             )
         )
 
-        # Configure tools
-        tools = types.Tool(function_declarations=COACH_TOOLS)
-        config = types.GenerateContentConfig(
-            system_instruction=COACH_SYSTEM_PROMPT,
-            tools=[tools],
-            temperature=0.7,
-        )
+        config = COACH_CONFIG
 
         # Generate response
         response = self.client.models.generate_content(
@@ -389,17 +483,25 @@ class CoachService:
             # Add model's function call request to history
             self.conversation_history.append(candidate.content)
 
-            # Execute each function call
-            function_responses = []
-            for part in candidate.content.parts:
-                if hasattr(part, 'function_call') and part.function_call:
-                    result = self._execute_function(part.function_call)
-                    function_responses.append(
-                        types.Part.from_function_response(
-                            name=part.function_call.name,
-                            response={"result": result}
-                        )
-                    )
+            # Execute function calls concurrently (each handler is independent DB I/O)
+            calls = [
+                part.function_call for part in candidate.content.parts
+                if hasattr(part, 'function_call') and part.function_call
+            ]
+            if len(calls) > 1:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=len(calls)) as executor:
+                    results = list(executor.map(self._execute_function, calls))
+            else:
+                results = [self._execute_function(call) for call in calls]
+
+            # Responses keep the order the model requested them in
+            function_responses = [
+                types.Part.from_function_response(
+                    name=call.name,
+                    response={"result": result}
+                )
+                for call, result in zip(calls, results)
+            ]
 
             # Add function responses to history
             self.conversation_history.append(
@@ -422,35 +524,129 @@ class CoachService:
 
         # Add assistant response to history
         self.conversation_history.append(candidate.content)
+        self._trim_history()
 
         return response_text.strip()
 
+    def _trim_history(self):
+        """
+        Keep the prompt bounded by dropping the oldest turns once the history
+        exceeds MAX_HISTORY_CONTENTS. Cuts only at a user text message so a
+        function call is never separated from its response.
+        """
+        history = self.conversation_history
+        if len(history) <= MAX_HISTORY_CONTENTS:
+            return
+
+        for i in range(len(history) - MAX_HISTORY_CONTENTS, len(history)):
+            content = history[i]
+            if content.role == "user" and any(
+                    hasattr(part, 'text') and part.text for part in content.parts
+            ):
+                self.conversation_history = history[i:]
+                return
+
     def reset_conversation(self):
         """Clear conversation history."""
-        self.conversation_history = []
+        # Waits for an in-flight turn, which would otherwise save the old history back
+        with self._lock:
+            self.conversation_history = []
+            self._workout_cache.clear()
+            if self.history_store:
+                self.history_store.delete(self.user_id)
 
     def get_history(self) -> list[dict]:
         """Get conversation history in a simple format."""
-        history = []
-        for content in self.conversation_history:
-            role = content.role
-            text = ""
-            for part in content.parts:
-                if hasattr(part, 'text') and part.text:
-                    text += part.text
-            if text:
-                history.append({"role": role, "text": text})
-        return history
+        if self.history_store:
+            return simple_history(self.history_store.load(self.user_id) or [])
+        return simple_history(self.conversation_history)
+
+
+def simple_history(contents: list[types.Content]) -> list[dict]:
+    """Conversation contents as [{role, text}], skipping function-call turns."""
+    history = []
+    for content in contents:
+        role = content.role
+        text = ""
+        for part in content.parts:
+            if hasattr(part, 'text') and part.text:
+                text += part.text
+        if text:
+            history.append({"role": role, "text": text})
+    return history
 
 
 # ============================================================
 # Convenience function for one-off queries
 # ============================================================
 
+@lru_cache(maxsize=512)
+def _coach_for(user_id: str) -> CoachService:
+    """Reuse one CoachService per user across ask_coach calls."""
+    return CoachService(user_id)
+
+
 def ask_coach(user_id: str, question: str) -> str:
-    """Quick one-off question to the coach."""
-    coach = CoachService(user_id)
-    return coach.chat(question)
+    """Quick question to the user's cached coach."""
+    return _coach_for(user_id).chat(question)
+
+
+def reset_coach(user_id: str):
+    """Clear the cached coach's conversation for a user."""
+    _coach_for(user_id).reset_conversation()
+
+
+# Gemini Batch Mode accepts many inline requests per job; keep jobs small enough
+# that a single failure doesn't cost a whole backfill run.
+BATCH_MAX_SIZE = 100
+
+
+def _build_batch_context(user_id: str) -> str:
+    """Pre-materialize the data the coach would otherwise fetch via function calls."""
+    workout_cache = {}
+    context = {
+        "recent_workouts": handle_get_recent_workouts(user_id, workout_cache=workout_cache),
+        "muscle_balance": handle_get_muscle_balance(user_id, workout_cache=workout_cache),
+        "form_issues": handle_get_form_issues(user_id, workout_cache=workout_cache),
+    }
+    return json.dumps(context, default=str)
+
+
+def ask_coach_batch(items: list[tuple[str, str]], max_batch_size: int = BATCH_MAX_SIZE) -> list[str]:
+    """
+    Answer many (user_id, question) pairs with Gemini Batch Mode.
+    Meant for non-interactive jobs (nightly recommendations, backfills): each user's
+    data is embedded in the prompt up front, so no function-calling loop is needed.
+    Returns answers in the same order as `items` ("" for failed requests).
+    """
+    contexts: dict[str, str] = {}
+    answers: list[str] = []
+
+    for start in range(0, len(items), max_batch_size):
+        chunk = items[start:start + max_batch_size]
+
+        inline_requests = []
+        for user_id, question in chunk:
+            if user_id not in contexts:
+                contexts[user_id] = _build_batch_context(user_id)
+            inline_requests.append({
+                "contents": [{
+                    "role": "user",
+                    "parts": [{"text": f"User workout data (JSON):\n{contexts[user_id]}\n\nQuestion: {question}"}]
+                }],
+                "config": {
+                    "system_instruction": {"parts": [{"text": COACH_SYSTEM_PROMPT}]},
+                    "temperature": 0.7
+                }
+            })
+
+        texts = run_inline_batch(
+            inline_requests,
+            display_name=f"gymintel-coach-batch-{start // max_batch_size}"
+        )
+        answers.extend(text.strip() if text else "" for text in texts)
+
+    return answers
 
 
 # ============================================================
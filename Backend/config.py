@@ -13,10 +13,27 @@ class Settings(BaseSettings):
     # App
     APP_NAME: str = "GymIntel"
     DEBUG: bool = True
+    API_THREAD_POOL_SIZE: int = 32  # worker threads behind asyncio.to_thread
+    # >0 runs video analysis in that many worker processes instead of threads.
+    # Progress updates from those processes are only visible with REDIS_URL set.
+    VIDEO_PROCESS_WORKERS: int = 0
+    # Analyses running at once in-process; further uploads queue behind them
+    VIDEO_THREAD_WORKERS: int = 2
 
     # MongoDB
     MONGODB_URI: str = "mongodb://localhost:27017"
     MONGODB_DB_NAME: str = "gymintel"
+    MONGODB_MAX_POOL_SIZE: int = 20  # per process; multiply by worker count for Atlas limits
+    MONGODB_MIN_POOL_SIZE: int = 2
+
+    # Redis (optional; shares processing status and coach history across API workers)
+    REDIS_URL: str = ""
+    COACH_SESSION_CACHE_SIZE: int = 1000  # CoachService instances kept per worker
+
+    # Pose analysis (MediaPipe). A pose_landmarker .task file switches to the Tasks API,
+    # which can run on the GPU delegate; otherwise the bundled CPU Pose solution is used.
+    POSE_LANDMARKER_MODEL: str = ""
+    POSE_USE_GPU: bool = True
 
     # TwelveLabs
     TWELVELABS_API_KEY: str = ""
@@ -26,6 +43,8 @@ class Settings(BaseSettings):
     GOOGLE_API_KEY: str = ""
     GEMINI_MODEL: str = "gemini-2.0-flash-exp"
     GEMINI_ANALYSIS_MODEL: str = "gemini-2.0-flash-exp"
+    GEMINI_TIMEOUT_MS: int = 60_000
+    GEMINI_MAX_CONNECTIONS: int = 32  # keepalive pool shared by all Gemini calls
 
     # Snowflake (for social/benchmarking features)
     SNOWFLAKE_ACCOUNT: str = ""
@@ -61,6 +80,9 @@ settings = get_settings()
 MONGODB_URI=mongodb+srv://<user>:<password>@cluster.mongodb.net/?retryWrites=true&w=majority
 MONGODB_DB_NAME=gymintel
 
+# Redis (optional)
+REDIS_URL=redis://localhost:6379/0
+
 # TwelveLabs
 TWELVELABS_API_KEY=your_twelvelabs_api_key_here
 
@@ -2,15 +2,29 @@
 GymIntel Database Module
 MongoDB connection and CRUD operations using PyMongo.
 """
-from datetime import datetime, timedelta
-from typing import Optional
-from pymongo import MongoClient
+import re
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, Optional
+from pymongo import MongoClient, IndexModel, ReturnDocument, ASCENDING, DESCENDING
 from pymongo.database import Database
 from pymongo.collection import Collection
 from bson import ObjectId
+from bson.errors import InvalidId
 
 from config import settings
-from models import User, Workout, WorkoutHistory, WorkoutStatus
+from models import (
+    User, Workout, WorkoutHistory, WorkoutStatus,
+    ExerciseSegment, FormFeedback, MuscleActivationSummary
+)
+
+_UTC = timezone.utc
+
+
+def _now() -> datetime:
+    """Current UTC time (timezone-aware; PyMongo stores it as UTC)."""
+    return datetime.now(_UTC)
+
 
 # ============================================================
 # Database Connection
@@ -24,7 +38,16 @@ def get_client() -> MongoClient:
     """Get MongoDB client (singleton)."""
     global _client
     if _client is None:
-        _client = MongoClient(settings.MONGODB_URI)
+        _client = MongoClient(
+            settings.MONGODB_URI,
+            maxPoolSize=settings.MONGODB_MAX_POOL_SIZE,
+            minPoolSize=settings.MONGODB_MIN_POOL_SIZE,
+            # Negotiated with the server; unavailable codecs are skipped
+            compressors="zstd,snappy,zlib",
+            retryWrites=True,
+            serverSelectionTimeoutMS=3000,
+            appname=settings.APP_NAME,
+        )
     return _client
 
 
@@ -65,22 +88,54 @@ def history_collection() -> Collection:
 # User Operations
 # ============================================================
 
+def to_object_id(value: str) -> Optional[ObjectId]:
+    """Parse an ObjectId once; returns None for malformed IDs."""
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        return None
+
+
 def create_user(user: User) -> str:
     """Create a new user and return the ID."""
     user_dict = user.model_dump(by_alias=True, exclude={"id"})
-    user_dict["created_at"] = datetime.utcnow()
-    user_dict["updated_at"] = datetime.utcnow()
+    now = _now()
+    user_dict["created_at"] = now
+    user_dict["updated_at"] = now
     result = users_collection().insert_one(user_dict)
     return str(result.inserted_id)
 
 
+def get_or_create_user(user: User) -> tuple[str, bool]:
+    """
+    Insert the user unless one with the same email exists, in a single upsert.
+    Returns (user_id, created). The unique email index makes concurrent calls safe.
+    """
+    user_dict = user.model_dump(by_alias=True, exclude={"id"})
+    now = _now()
+    user_dict["created_at"] = now
+    user_dict["updated_at"] = now
+    # A client-side _id tells an insert apart from a match without a second query
+    user_dict["_id"] = new_id = ObjectId()
+
+    doc = users_collection().find_one_and_update(
+        {"email": user.email},
+        {"$setOnInsert": user_dict},
+        projection={"_id": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return str(doc["_id"]), doc["_id"] == new_id
+
+
 def get_user(user_id: str) -> Optional[User]:
     """Get user by ID."""
+    oid = to_object_id(user_id)
+    if oid is None:
+        return None
+
     try:
-        if not ObjectId.is_valid(user_id):
-            return None
-            
-        doc = users_collection().find_one({"_id": ObjectId(user_id)})
+        doc = users_collection().find_one({"_id": oid})
         if doc:
             doc["_id"] = str(doc["_id"])
             return User(**doc)
@@ -100,9 +155,13 @@ def get_user_by_email(email: str) -> Optional[User]:
 
 def update_user(user_id: str, updates: dict) -> bool:
     """Update user fields."""
-    updates["updated_at"] = datetime.utcnow()
+    oid = to_object_id(user_id)
+    if oid is None:
+        return False
+
+    updates["updated_at"] = _now()
     result = users_collection().update_one(
-        {"_id": ObjectId(user_id)},
+        {"_id": oid},
         {"$set": updates}
     )
     return result.modified_count > 0
@@ -110,14 +169,18 @@ def update_user(user_id: str, updates: dict) -> bool:
 
 def increment_user_stats(user_id: str, duration_min: float):
     """Increment user workout stats."""
+    oid = to_object_id(user_id)
+    if oid is None:
+        return
+
     users_collection().update_one(
-        {"_id": ObjectId(user_id)},
+        {"_id": oid},
         {
             "$inc": {
                 "total_workouts": 1,
                 "total_duration_min": duration_min
             },
-            "$set": {"updated_at": datetime.utcnow()}
+            "$set": {"updated_at": _now()}
         }
     )
 
@@ -126,29 +189,61 @@ def increment_user_stats(user_id: str, duration_min: float):
 # Workout Operations
 # ============================================================
 
+def workout_from_doc(doc: dict) -> Workout:
+    """
+    Build a Workout from a stored document without re-running validation.
+    Read path only: documents were validated by this app when they were written.
+    Nested models are constructed explicitly since model_construct doesn't cascade.
+    """
+    doc["id"] = str(doc.pop("_id"))
+
+    exercises = []
+    for ex in doc.get("exercises") or []:
+        ex["form_feedback"] = [
+            FormFeedback.model_construct(**fb) for fb in ex.get("form_feedback") or []
+        ]
+        exercises.append(ExerciseSegment.model_construct(**ex))
+    doc["exercises"] = exercises
+
+    if "muscle_activation" in doc:
+        doc["muscle_activation"] = MuscleActivationSummary.model_construct(
+            **(doc["muscle_activation"] or {})
+        )
+
+    return Workout.model_construct(**doc)
+
+
 def create_workout(workout: Workout) -> str:
     """Create a new workout and return the ID."""
     workout_dict = workout.model_dump(by_alias=True, exclude={"id"})
-    workout_dict["created_at"] = datetime.utcnow()
-    workout_dict["updated_at"] = datetime.utcnow()
+    now = _now()
+    workout_dict["created_at"] = now
+    workout_dict["updated_at"] = now
     result = workouts_collection().insert_one(workout_dict)
     return str(result.inserted_id)
 
 
 def get_workout(workout_id: str) -> Optional[Workout]:
     """Get workout by ID."""
-    doc = workouts_collection().find_one({"_id": ObjectId(workout_id)})
+    oid = to_object_id(workout_id)
+    if oid is None:
+        return None
+
+    doc = workouts_collection().find_one({"_id": oid})
     if doc:
-        doc["_id"] = str(doc["_id"])
-        return Workout(**doc)
+        return workout_from_doc(doc)
     return None
 
 
 def update_workout(workout_id: str, updates: dict) -> bool:
     """Update workout fields."""
-    updates["updated_at"] = datetime.utcnow()
+    oid = to_object_id(workout_id)
+    if oid is None:
+        return False
+
+    updates["updated_at"] = _now()
     result = workouts_collection().update_one(
-        {"_id": ObjectId(workout_id)},
+        {"_id": oid},
         {"$set": updates}
     )
     return result.modified_count > 0
@@ -156,90 +251,211 @@ def update_workout(workout_id: str, updates: dict) -> bool:
 
 def update_workout_status(workout_id: str, status: WorkoutStatus, error: str = None):
     """Update workout processing status."""
-    updates = {"status": status.value, "updated_at": datetime.utcnow()}
+    oid = to_object_id(workout_id)
+    if oid is None:
+        return
+
+    updates = {"status": status.value, "updated_at": _now()}
     if error:
         updates["error_message"] = error
     workouts_collection().update_one(
-        {"_id": ObjectId(workout_id)},
+        {"_id": oid},
         {"$set": updates}
     )
 
 
+# Fields the compact workout list shows; user_id keeps the documents valid `Workout`s.
+WORKOUT_LIST_PROJECTION = {
+    "user_id": 1,
+    "created_at": 1,
+    "status": 1,
+    "form_score": 1,
+    "video_duration_sec": 1,
+    "exercises.name": 1,
+}
+
+
 def get_user_workouts(
         user_id: str,
         limit: int = 10,
         skip: int = 0,
-        status: Optional[WorkoutStatus] = None
+        status: Optional[WorkoutStatus] = None,
+        projection: Optional[dict] = None
 ) -> list[Workout]:
-    """Get workouts for a user, sorted by date descending."""
+    """
+    Get workouts for a user, sorted by date descending.
+    Pass a `projection` (e.g. WORKOUT_LIST_PROJECTION) to fetch only those fields.
+    """
     query = {"user_id": user_id}
     if status:
         query["status"] = status.value
 
-    cursor = workouts_collection().find(query) \
+    cursor = workouts_collection().find(query, projection) \
         .sort("created_at", -1) \
         .skip(skip) \
         .limit(limit)
 
-    workouts = []
-    for doc in cursor:
-        doc["_id"] = str(doc["_id"])
-        workouts.append(Workout(**doc))
-    return workouts
+    return [workout_from_doc(doc) for doc in cursor]
 
 
-def get_recent_workouts(user_id: str, days: int = 30) -> list[Workout]:
-    """Get workouts from the last N days."""
-    cutoff = datetime.utcnow() - timedelta(days=days)
+# Fields the coach and aggregation helpers actually read from a workout.
+# user_id is kept so the projected documents still validate as `Workout`.
+RECENT_WORKOUT_PROJECTION = {
+    "user_id": 1,
+    "created_at": 1,
+    "form_score": 1,
+    "video_duration_sec": 1,
+    "exercises.name": 1,
+    "exercises.reps": 1,
+    "exercises.sets": 1,
+    "exercises.weight_kg": 1,
+    "exercises.avg_quality_score": 1,
+    "exercises.form_feedback": 1,
+    "muscle_activation.muscles": 1,
+}
+
+
+def iter_recent_workouts(
+        user_id: str,
+        days: int = 30,
+        projection: Optional[dict] = None,
+        limit: int = 0
+) -> Iterator[Workout]:
+    """
+    Yield workouts from the last N days, newest first, one document at a time.
+    Pass a `projection` (e.g. RECENT_WORKOUT_PROJECTION) to fetch only the fields
+    you need; omitted fields fall back to the model defaults.
+    A non-zero `limit` is pushed down to the cursor.
+    """
+    cutoff = _now() - timedelta(days=days)
     cursor = workouts_collection().find({
         "user_id": user_id,
         "status": WorkoutStatus.COMPLETE.value,
         "created_at": {"$gte": cutoff}
-    }).sort("created_at", -1)
+    }, projection).sort("created_at", -1).limit(limit)
 
-    workouts = []
     for doc in cursor:
-        doc["_id"] = str(doc["_id"])
-        workouts.append(Workout(**doc))
-    return workouts
+        yield workout_from_doc(doc)
+
+
+def get_recent_workouts(
+        user_id: str,
+        days: int = 30,
+        projection: Optional[dict] = None
+) -> list[Workout]:
+    """Get workouts from the last N days."""
+    return list(iter_recent_workouts(user_id, days, projection))
 
 
 # ============================================================
 # Aggregation Queries
 # ============================================================
 
-def get_muscle_activation_history(user_id: str, days: int = 30) -> list[dict[str, float]]:
-    """Get muscle activation from recent workouts."""
-    workouts = get_recent_workouts(user_id, days)
+SEVERE_FORM_SEVERITIES = frozenset({"warning", "critical"})
+
+
+def get_muscle_activation_history(
+        user_id: str,
+        days: int = 30,
+        workouts: Optional[list[Workout]] = None
+) -> list[dict[str, float]]:
+    """Get muscle activation from recent workouts (reuses `workouts` if already fetched)."""
+    if workouts is None:
+        workouts = get_recent_workouts(user_id, days)
     return [w.muscle_activation.muscles for w in workouts if w.muscle_activation.muscles]
 
 
-def get_exercise_frequency(user_id: str, days: int = 30) -> dict[str, int]:
-    """Get exercise frequency counts."""
-    workouts = get_recent_workouts(user_id, days)
-    counts = {}
-    for w in workouts:
-        for ex in w.exercises:
-            counts[ex.name] = counts.get(ex.name, 0) + 1
-    return counts
-
-
-def get_form_issues_summary(user_id: str, days: int = 30) -> list[dict]:
-    """Get summary of form issues across recent workouts."""
-    workouts = get_recent_workouts(user_id, days)
-    issues = []
-    for w in workouts:
-        for ex in w.exercises:
-            for fb in ex.form_feedback:
-                if fb.severity in ["warning", "critical"]:
-                    issues.append({
-                        "workout_id": w.id,
-                        "exercise": ex.name,
-                        "timestamp": fb.timestamp_sec,
-                        "severity": fb.severity,
-                        "note": fb.note
-                    })
-    return issues
+def get_exercise_frequency(
+        user_id: str,
+        days: int = 30,
+        workouts: Optional[list[Workout]] = None
+) -> dict[str, int]:
+    """Get exercise frequency counts (reuses `workouts` if already fetched)."""
+    if workouts is None:
+        workouts = get_recent_workouts(user_id, days)
+    return dict(Counter(ex.name for w in workouts for ex in w.exercises))
+
+
+def get_form_issues_summary(
+        user_id: str,
+        days: int = 30,
+        workouts: Optional[list[Workout]] = None
+) -> list[dict]:
+    """Get summary of form issues across recent workouts (reuses `workouts` if already fetched)."""
+    if workouts is None:
+        workouts = get_recent_workouts(user_id, days)
+    return [
+        {
+            "workout_id": w.id,
+            "exercise": ex.name,
+            "timestamp": fb.timestamp_sec,
+            "severity": fb.severity,
+            "note": fb.note
+        }
+        for w in workouts
+        for ex in w.exercises
+        for fb in ex.form_feedback
+        if fb.severity in SEVERE_FORM_SEVERITIES
+    ]
+
+
+# Per-severity form feedback counts; expects documents already unwound by exercise
+FORM_ISSUE_COUNT_STAGES = [
+    {"$unwind": "$exercises.form_feedback"},
+    {"$group": {"_id": "$exercises.form_feedback.severity", "count": {"$sum": 1}}}
+]
+
+
+def get_form_issues_with_counts(
+        user_id: str,
+        days: int = 30,
+        exercise: Optional[str] = None,
+        limit: int = 10
+) -> dict:
+    """
+    The `limit` most recent warning/critical form issues plus feedback counts per
+    severity (e.g. {"critical": 2, "warning": 5}), in one aggregation round-trip.
+    `exercise` filters by case-insensitive substring of the exercise name.
+    Returns { "counts": dict[str, int], "issues": list[dict] } with issues shaped like get_form_issues_summary.
+    """
+    pipeline = [
+        {
+            "$match": {
+                "user_id": user_id,
+                "status": WorkoutStatus.COMPLETE.value,
+                "created_at": {"$gte": _now() - timedelta(days=days)}
+            }
+        },
+        {"$sort": {"created_at": -1}},
+        {"$unwind": "$exercises"},
+    ]
+    if exercise:
+        pipeline.append({"$match": {"exercises.name": {"$regex": re.escape(exercise), "$options": "i"}}})
+    pipeline.append({
+        "$facet": {
+            "counts": FORM_ISSUE_COUNT_STAGES,
+            "issues": [
+                {"$unwind": "$exercises.form_feedback"},
+                {"$match": {"exercises.form_feedback.severity": {"$in": sorted(SEVERE_FORM_SEVERITIES)}}},
+                {"$limit": limit},
+                {
+                    "$project": {
+                        "_id": 0,
+                        "workout_id": {"$toString": "$_id"},
+                        "exercise": "$exercises.name",
+                        "timestamp": "$exercises.form_feedback.timestamp_sec",
+                        "severity": "$exercises.form_feedback.severity",
+                        "note": "$exercises.form_feedback.note"
+                    }
+                }
+            ]
+        }
+    })
+    result = next(workouts_collection().aggregate(pipeline))
+    return {
+        "counts": {row["_id"]: row["count"] for row in result["counts"]},
+        "issues": result["issues"]
+    }
 
 
 def get_avg_form_score(user_id: str, days: int = 30) -> Optional[float]:
@@ -249,7 +465,7 @@ def get_avg_form_score(user_id: str, days: int = 30) -> Optional[float]:
             "$match": {
                 "user_id": user_id,
                 "status": WorkoutStatus.COMPLETE.value,
-                "created_at": {"$gte": datetime.utcnow() - timedelta(days=days)},
+                "created_at": {"$gte": _now() - timedelta(days=days)},
                 "form_score": {"$ne": None}
             }
         },
@@ -264,6 +480,286 @@ def get_avg_form_score(user_id: str, days: int = 30) -> Optional[float]:
     return result[0]["avg_score"] if result else None
 
 
+DASHBOARD_RECENT_LIMIT = 5
+
+# Fields shown in the dashboard's recent-workouts preview
+DASHBOARD_RECENT_PROJECTION = {
+    "user_id": 1,
+    "created_at": 1,
+    "form_score": 1,
+    "video_duration_sec": 1,
+    "exercises.name": 1,
+}
+
+
+def get_dashboard_bundle(user_id: str, days: int = 30) -> dict:
+    """
+    Fetch everything the dashboard needs in one aggregation round-trip.
+    Counts, duration, average form score, exercise frequency and form issue
+    counts per severity are computed server-side; only the preview workouts and the per-session
+    muscle activations come back as documents.
+    """
+    pipeline = [
+        {
+            "$match": {
+                "user_id": user_id,
+                "status": WorkoutStatus.COMPLETE.value,
+                "created_at": {"$gte": _now() - timedelta(days=days)}
+            }
+        },
+        {"$sort": {"created_at": -1}},
+        {
+            "$facet": {
+                "totals": [
+                    {
+                        "$group": {
+                            "_id": None,
+                            "workout_count": {"$sum": 1},
+                            "total_duration_sec": {"$sum": "$video_duration_sec"},
+                            "avg_form_score": {"$avg": "$form_score"}
+                        }
+                    }
+                ],
+                "recent": [
+                    {"$limit": DASHBOARD_RECENT_LIMIT},
+                    {"$project": DASHBOARD_RECENT_PROJECTION}
+                ],
+                "activations": [
+                    {"$match": {"muscle_activation.muscles": {"$exists": True, "$ne": {}}}},
+                    {"$project": {"_id": 0, "muscles": "$muscle_activation.muscles"}}
+                ],
+                "exercise_frequency": [
+                    {"$unwind": "$exercises"},
+                    {"$sortByCount": "$exercises.name"}
+                ],
+                "form_issue_counts": [
+                    {"$unwind": "$exercises"},
+                    *FORM_ISSUE_COUNT_STAGES
+                ]
+            }
+        }
+    ]
+    result = next(workouts_collection().aggregate(pipeline))
+
+    totals = result["totals"][0] if result["totals"] else {}
+    return {
+        "workout_count": totals.get("workout_count", 0),
+        "total_duration_min": totals.get("total_duration_sec", 0) / 60,
+        "avg_form_score": totals.get("avg_form_score"),
+        "recent_workouts": [workout_from_doc(doc) for doc in result["recent"]],
+        "activation_history": [doc["muscles"] for doc in result["activations"]],
+        "exercise_frequency": {row["_id"]: row["count"] for row in result["exercise_frequency"]},
+        "form_issue_counts": {row["_id"]: row["count"] for row in result["form_issue_counts"]},
+    }
+
+
+def _nonzero_or_null(field: str) -> dict:
+    """Aggregation expression mapping 0/missing to null so $avg skips it."""
+    return {"$cond": [{"$eq": [{"$ifNull": [field, 0]}, 0]}, None, field]}
+
+
+def get_user_window_stats(user_id: str, days: int = 30) -> dict:
+    """
+    Per-user stats for public comparison in one aggregation round-trip:
+    workout count, average form score, mean muscle activation per session
+    and average knee/hip depth across exercises.
+    """
+    has_activation = {"muscle_activation.muscles": {"$exists": True, "$ne": {}}}
+    pipeline = [
+        {
+            "$match": {
+                "user_id": user_id,
+                "status": WorkoutStatus.COMPLETE.value,
+                "created_at": {"$gte": _now() - timedelta(days=days)}
+            }
+        },
+        {
+            "$facet": {
+                "totals": [
+                    {
+                        "$group": {
+                            "_id": None,
+                            "workout_count": {"$sum": 1},
+                            "avg_form_score": {"$avg": "$form_score"}
+                        }
+                    }
+                ],
+                "activation_sessions": [
+                    {"$match": has_activation},
+                    {"$count": "count"}
+                ],
+                "muscle_totals": [
+                    {"$match": has_activation},
+                    {"$project": {"muscles": {"$objectToArray": "$muscle_activation.muscles"}}},
+                    {"$unwind": "$muscles"},
+                    {"$group": {"_id": "$muscles.k", "total": {"$sum": "$muscles.v"}}}
+                ],
+                "depths": [
+                    {"$unwind": "$exercises"},
+                    {
+                        "$group": {
+                            "_id": None,
+                            "knee": {"$avg": _nonzero_or_null("$exercises.range_of_motion.knee_depth")},
+                            "hip": {"$avg": _nonzero_or_null("$exercises.range_of_motion.hip_depth")}
+                        }
+                    }
+                ]
+            }
+        }
+    ]
+    result = next(workouts_collection().aggregate(pipeline))
+
+    totals = result["totals"][0] if result["totals"] else {}
+    depths = result["depths"][0] if result["depths"] else {}
+    sessions = result["activation_sessions"][0]["count"] if result["activation_sessions"] else 0
+    return {
+        "workout_count": totals.get("workout_count", 0),
+        "avg_form_score": totals.get("avg_form_score"),
+        "muscle_activation": {
+            row["_id"]: row["total"] / sessions for row in result["muscle_totals"]
+        } if sessions else {},
+        "avg_knee_depth": depths.get("knee") or 0,
+        "avg_hip_depth": depths.get("hip") or 0,
+    }
+
+
+# Percentiles reported in public stats; $percentile needs MongoDB 7.0+
+PUBLIC_PERCENTILE_POINTS = (25, 50, 75, 90)
+
+
+def _percentiles_of(expr) -> dict:
+    """Approximate $percentile accumulator at PUBLIC_PERCENTILE_POINTS; nulls are skipped."""
+    return {
+        "$percentile": {
+            "input": expr,
+            "p": [point / 100 for point in PUBLIC_PERCENTILE_POINTS],
+            "method": "approximate"
+        }
+    }
+
+
+def get_public_stats_bundle() -> dict:
+    """
+    Cross-user stats in one workouts aggregation plus the registered user count:
+    workout totals, form score average/percentiles, mean activation per muscle
+    and knee/hip depth averages/percentiles. Only summary rows come back.
+    Percentile values are lists ordered like PUBLIC_PERCENTILE_POINTS, or None.
+    """
+    # Averages cover workouts with activation data; form percentiles every scored workout
+    has_muscles = {"$ne": [{"$type": "$muscle_activation.muscles"}, "missing"]}
+    with_muscles = {"muscle_activation.muscles": {"$exists": True}}
+    knee = _nonzero_or_null("$exercises.range_of_motion.knee_depth")
+    hip = _nonzero_or_null("$exercises.range_of_motion.hip_depth")
+    pipeline = [
+        {"$match": {"status": WorkoutStatus.COMPLETE.value}},
+        {
+            "$facet": {
+                "form": [
+                    {
+                        "$group": {
+                            "_id": None,
+                            "total_workouts": {"$sum": 1},
+                            "with_muscles": {"$sum": {"$cond": [has_muscles, 1, 0]}},
+                            "avg_form_score": {"$avg": {"$cond": [has_muscles, "$form_score", None]}},
+                            "form_percentiles": _percentiles_of("$form_score")
+                        }
+                    }
+                ],
+                "muscles": [
+                    {"$match": with_muscles},
+                    {"$project": {"muscles": {"$objectToArray": "$muscle_activation.muscles"}}},
+                    {"$unwind": "$muscles"},
+                    {"$group": {"_id": "$muscles.k", "avg": {"$avg": "$muscles.v"}}}
+                ],
+                "depths": [
+                    {"$match": with_muscles},
+                    {"$unwind": "$exercises"},
+                    {
+                        "$group": {
+                            "_id": None,
+                            "knee_avg": {"$avg": knee},
+                            "knee_percentiles": _percentiles_of(knee),
+                            "hip_avg": {"$avg": hip},
+                            "hip_percentiles": _percentiles_of(hip)
+                        }
+                    }
+                ]
+            }
+        }
+    ]
+    result = next(workouts_collection().aggregate(pipeline))
+
+    form = result["form"][0] if result["form"] else {}
+    depths = result["depths"][0] if result["depths"] else {}
+
+    def percentiles(values):
+        return values if values and values[0] is not None else None
+
+    return {
+        # A different collection, so not part of the $facet
+        "total_users": users_collection().count_documents({"registration_complete": True}),
+        "total_workouts": form.get("total_workouts", 0),
+        "workouts_with_activation": form.get("with_muscles", 0),
+        "avg_form_score": form.get("avg_form_score"),
+        "form_percentiles": percentiles(form.get("form_percentiles")),
+        "avg_muscle_activation": {row["_id"]: row["avg"] for row in result["muscles"]},
+        "avg_knee_depth": depths.get("knee_avg"),
+        "knee_percentiles": percentiles(depths.get("knee_percentiles")),
+        "avg_hip_depth": depths.get("hip_avg"),
+        "hip_percentiles": percentiles(depths.get("hip_percentiles")),
+    }
+
+
+def get_exercise_stats(user_id: str, exercise: str, days: int = 30) -> dict:
+    """
+    Aggregate totals and the most common form issues for one exercise.
+    Matches exercise names case-insensitively by substring.
+    """
+    pipeline = [
+        {
+            "$match": {
+                "user_id": user_id,
+                "status": WorkoutStatus.COMPLETE.value,
+                "created_at": {"$gte": _now() - timedelta(days=days)}
+            }
+        },
+        {"$unwind": "$exercises"},
+        {"$match": {"exercises.name": {"$regex": re.escape(exercise), "$options": "i"}}},
+        {
+            "$facet": {
+                "totals": [
+                    {
+                        "$group": {
+                            "_id": None,
+                            "times_performed": {"$sum": 1},
+                            "total_reps": {"$sum": "$exercises.reps"},
+                            "total_sets": {"$sum": "$exercises.sets"}
+                        }
+                    }
+                ],
+                "common_issues": [
+                    {"$unwind": "$exercises.form_feedback"},
+                    {"$match": {"exercises.form_feedback.severity": {"$in": ["warning", "critical"]}}},
+                    # $sort followed by $limit is coalesced into a bounded top-k sort
+                    {"$sortByCount": "$exercises.form_feedback.note"},
+                    {"$limit": 3}
+                ]
+            }
+        }
+    ]
+    result = list(workouts_collection().aggregate(pipeline))
+    facets = result[0] if result else {}
+    totals = facets.get("totals") or [{}]
+
+    return {
+        "exercise": exercise,
+        "times_performed": totals[0].get("times_performed", 0),
+        "total_reps": totals[0].get("total_reps", 0),
+        "total_sets": totals[0].get("total_sets", 0),
+        "common_issues": [issue["_id"] for issue in facets.get("common_issues", [])]
+    }
+
+
 # ============================================================
 # Database Initialization
 # ============================================================
@@ -272,16 +768,29 @@ def init_database():
     """Initialize database with indexes."""
     db = get_database()
 
-    # Users indexes
-    db.users.create_index("email", unique=True)
-
-    # Workouts indexes
-    db.workouts.create_index([("user_id", 1), ("created_at", -1)])
-    db.workouts.create_index("status")
-    db.workouts.create_index("twelvelabs_asset_id")
-
-    # History indexes
-    db.workout_history.create_index([("user_id", 1), ("period_start", -1)])
+    # create_indexes sends one createIndexes command per collection and is a
+    # no-op for indexes that already exist
+    db.users.create_indexes([
+        IndexModel("email", unique=True),
+        # Registered-user count in public stats becomes an index-only COUNT_SCAN
+        IndexModel("registration_complete"),
+    ])
+
+    db.workouts.create_indexes([
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)]),
+        # Equality (user_id, status) then range/sort (created_at) for get_recent_workouts
+        # and the dashboard aggregation; its (user_id, status) prefix also serves
+        # status-filtered get_user_workouts, so no separate two-field index is needed
+        IndexModel([("user_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING)]),
+        # Public stats match every complete workout; form scores are no longer
+        # queried on their own, so status alone covers that path
+        IndexModel("status"),
+        IndexModel("twelvelabs_asset_id"),
+    ])
+
+    db.workout_history.create_indexes([
+        IndexModel([("user_id", ASCENDING), ("period_start", DESCENDING)]),
+    ])
 
     print("Database indexes created successfully")
 
@@ -2,8 +2,16 @@
 GymIntel Gemini Service
 AI-powered insights, recommendations, and analysis using Google Gemini.
 """
+import heapq
+import importlib.util
 import json
+import re
+import time
+from functools import lru_cache
+from operator import itemgetter
+from string import Formatter
 from typing import Optional
+import httpx
 from google import genai
 from google.genai import types
 
@@ -19,12 +27,32 @@ import io
 
 _client: Optional[genai.Client] = None
 
+# HTTP/2 needs the optional h2 package; fall back to HTTP/1.1 keepalive without it
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+def _http_options() -> types.HttpOptions:
+    """Shared transport settings: one keepalive pool per process, bounded timeout."""
+    limits = httpx.Limits(
+        max_connections=settings.GEMINI_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.GEMINI_MAX_CONNECTIONS,
+    )
+    transport_args = {"limits": limits, "http2": _HTTP2_AVAILABLE}
+    return types.HttpOptions(
+        timeout=settings.GEMINI_TIMEOUT_MS,
+        client_args=transport_args,
+        async_client_args=transport_args,
+    )
+
 
 def get_client() -> genai.Client:
     """Get Gemini client (singleton)."""
     global _client
     if _client is None:
-        _client = genai.Client(api_key=settings.GOOGLE_API_KEY)
+        _client = genai.Client(
+            api_key=settings.GOOGLE_API_KEY,
+            http_options=_http_options(),
+        )
     return _client
 
 
@@ -61,7 +89,6 @@ def estimate_weight_from_image(image_bytes: bytes, exercise_name: str) -> float:
         
         text = response.text.strip().lower()
         # Extract number
-        import re
         match = re.search(r"(\d+(\.\d+)?)", text)
         if match:
             return float(match.group(1))
@@ -139,15 +166,53 @@ Be encouraging but honest about safety concerns.
 Respond in JSON format with "score" (0-100), "good_points", "issues", and "tips" arrays.
 """
 
+RECOMMENDATIONS_PROMPT = """
+Based on this training data, suggest 3-5 exercises to add to future workouts.
+
+Undertrained muscles: {undertrained}
+Recent exercises: {recent_exercises}
+Training goals: {goals}
+
+Provide specific exercise recommendations that would:
+1. Address any muscle imbalances
+2. Complement existing training
+3. Align with stated goals
+
+Format as a simple list, one exercise per line.
+"""
+
+
+def _compile_template(template: str) -> tuple[tuple[str, Optional[str], str], ...]:
+    """Pre-parse a str.format template into (literal, field_name, format_spec) chunks."""
+    return tuple(
+        (literal, field_name, format_spec or "")
+        for literal, field_name, format_spec, _ in Formatter().parse(template)
+    )
+
+
+def _fill(compiled: tuple[tuple[str, Optional[str], str], ...], **values) -> str:
+    """Render a template compiled by _compile_template without re-parsing it."""
+    parts = []
+    for literal, field_name, format_spec in compiled:
+        parts.append(literal)
+        if field_name is not None:
+            parts.append(format(values[field_name], format_spec))
+    return "".join(parts)
+
+
+# Parsed once at import instead of on every LLM call
+_WORKOUT_SUMMARY_TEMPLATE = _compile_template(WORKOUT_SUMMARY_PROMPT)
+_INSIGHTS_TEMPLATE = _compile_template(INSIGHTS_PROMPT)
+_FORM_FEEDBACK_TEMPLATE = _compile_template(FORM_FEEDBACK_PROMPT)
+_RECOMMENDATIONS_TEMPLATE = _compile_template(RECOMMENDATIONS_PROMPT)
+
 
 # ============================================================
 # Analysis Functions
 # ============================================================
 
-def generate_workout_summary(workout: Workout) -> str:
-    """Generate a brief summary of a workout."""
-    client = get_client()
-
+def _build_summary_prompt(workout: Workout) -> str:
+    """Format WORKOUT_SUMMARY_PROMPT for a workout."""
     # Prepare data for prompt
     exercise_list = ", ".join([ex.name for ex in workout.exercises])
     muscle_groups = ", ".join(workout.muscle_activation.primary_muscles[:5])
@@ -164,7 +229,8 @@ def generate_workout_summary(workout: Workout) -> str:
         if fb.severity in ["warning", "critical"]
     ]) or "No significant issues detected"
 
-    prompt = WORKOUT_SUMMARY_PROMPT.format(
+    return _fill(
+        _WORKOUT_SUMMARY_TEMPLATE,
         duration_min=workout.video_duration_sec / 60,
         exercise_list=exercise_list,
         muscle_groups=muscle_groups,
@@ -172,6 +238,12 @@ def generate_workout_summary(workout: Workout) -> str:
         form_issues=form_issues
     )
 
+
+def generate_workout_summary(workout: Workout) -> str:
+    """Generate a brief summary of a workout."""
+    client = get_client()
+    prompt = _build_summary_prompt(workout)
+
     response = client.models.generate_content(
         model=settings.GEMINI_ANALYSIS_MODEL,
         contents=prompt,
@@ -184,27 +256,28 @@ def generate_workout_summary(workout: Workout) -> str:
     return response.text.strip()
 
 
-def generate_training_insights(
+def _build_insights_prompt(
         workout_count: int,
         total_duration_min: float,
         exercise_frequency: dict[str, int],
         muscle_activation: dict[str, float],
         category_balance: dict[str, float],
         form_issues: list[dict]
-) -> list[dict]:
-    """Generate training insights from aggregated data."""
-    client = get_client()
-
+) -> str:
+    """Format INSIGHTS_PROMPT from aggregated training data."""
     # Format data for prompt
+    # Top 10 without sorting every exercise
     exercise_freq_str = "\n".join([
         f"- {name}: {count}x"
-        for name, count in sorted(exercise_frequency.items(), key=lambda x: -x[1])[:10]
+        for name, count in heapq.nlargest(10, exercise_frequency.items(), key=itemgetter(1))
     ])
 
+    # Filter before sorting so only the active muscles are ordered
+    active_muscles = [(m, v) for m, v in muscle_activation.items() if v > 0.1]
+    active_muscles.sort(key=itemgetter(1), reverse=True)
     muscle_str = "\n".join([
         f"- {muscle}: {activation * 100:.0f}%"
-        for muscle, activation in sorted(muscle_activation.items(), key=lambda x: -x[1])
-        if activation > 0.1
+        for muscle, activation in active_muscles
     ])
 
     form_issues_str = "\n".join([
@@ -212,7 +285,8 @@ def generate_training_insights(
         for issue in form_issues[:10]
     ]) or "No recurring form issues"
 
-    prompt = INSIGHTS_PROMPT.format(
+    return _fill(
+        _INSIGHTS_TEMPLATE,
         workout_count=workout_count,
         total_duration_min=total_duration_min,
         exercise_frequency=exercise_freq_str,
@@ -224,6 +298,44 @@ def generate_training_insights(
         form_issues=form_issues_str
     )
 
+
+_CODE_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.S)
+
+
+def _strip_code_fence(text: str) -> str:
+    """Return the contents of a markdown code block (```json ... ```) if present."""
+    match = _CODE_FENCE_RE.search(text)
+    return match.group(1) if match else text.strip()
+
+
+def _parse_insights(text: str) -> list[dict]:
+    """Parse the insights JSON array, falling back to a single info insight."""
+    try:
+        return json.loads(_strip_code_fence(text))
+    except json.JSONDecodeError:
+        # Fallback to simple parsing
+        return [{
+            "type": "info",
+            "severity": "info",
+            "message": text.strip()
+        }]
+
+
+def generate_training_insights(
+        workout_count: int,
+        total_duration_min: float,
+        exercise_frequency: dict[str, int],
+        muscle_activation: dict[str, float],
+        category_balance: dict[str, float],
+        form_issues: list[dict]
+) -> list[dict]:
+    """Generate training insights from aggregated data."""
+    client = get_client()
+    prompt = _build_insights_prompt(
+        workout_count, total_duration_min, exercise_frequency,
+        muscle_activation, category_balance, form_issues
+    )
+
     response = client.models.generate_content(
         model=settings.GEMINI_ANALYSIS_MODEL,
         contents=prompt,
@@ -233,22 +345,50 @@ def generate_training_insights(
         )
     )
 
-    # Parse JSON response
+    return _parse_insights(response.text)
+
+
+# Exercise-specific form cues
+FORM_CUES = {
+    "squat": "Knees should track over toes, back straight, depth to parallel or below",
+    "bench press": "Shoulders retracted, feet planted, bar path over mid-chest",
+    "deadlift": "Neutral spine, hips hinge first, bar close to body",
+    "pull-up": "Full extension at bottom, chin over bar at top, no kipping",
+    "overhead press": "Core braced, no excessive back arch, lockout overhead"
+}
+DEFAULT_FORM_CUE = "Maintain proper form throughout"
+_FORM_CUES_CASEFOLDED = {name.casefold(): cue for name, cue in FORM_CUES.items()}
+
+
+def _build_form_prompt(
+        exercise_name: str,
+        joint_angles: dict[str, float],
+        range_of_motion: dict[str, dict[str, float]]
+) -> str:
+    """Format FORM_FEEDBACK_PROMPT for one exercise's pose data."""
+    cues = _FORM_CUES_CASEFOLDED.get(exercise_name.casefold(), DEFAULT_FORM_CUE)
+
+    return _fill(
+        _FORM_FEEDBACK_TEMPLATE,
+        exercise_name=exercise_name,
+        # Compact JSON: indentation only adds prompt tokens
+        joint_angles=json.dumps(joint_angles, separators=(",", ":")),
+        range_of_motion=json.dumps(range_of_motion, separators=(",", ":")),
+        form_cues=cues
+    )
+
+
+def _parse_form_feedback(text: str) -> dict:
+    """Parse the form feedback JSON, falling back to a neutral score."""
     try:
-        # Clean up response (remove markdown code blocks if present)
-        text = response.text.strip()
-        if text.startswith("```"):
-            text = text.split("```")[1]
-            if text.startswith("json"):
-                text = text[4:]
-        return json.loads(text)
+        return json.loads(_strip_code_fence(text))
     except json.JSONDecodeError:
-        # Fallback to simple parsing
-        return [{
-            "type": "info",
-            "severity": "info",
-            "message": response.text.strip()
-        }]
+        return {
+            "score": 75,
+            "good_points": [],
+            "issues": [],
+            "tips": [text.strip()]
+        }
 
 
 def analyze_form_with_pose_data(
@@ -258,24 +398,7 @@ def analyze_form_with_pose_data(
 ) -> dict:
     """Analyze form using pose estimation data."""
     client = get_client()
-
-    # Exercise-specific form cues
-    FORM_CUES = {
-        "squat": "Knees should track over toes, back straight, depth to parallel or below",
-        "bench press": "Shoulders retracted, feet planted, bar path over mid-chest",
-        "deadlift": "Neutral spine, hips hinge first, bar close to body",
-        "pull-up": "Full extension at bottom, chin over bar at top, no kipping",
-        "overhead press": "Core braced, no excessive back arch, lockout overhead"
-    }
-
-    cues = FORM_CUES.get(exercise_name.lower(), "Maintain proper form throughout")
-
-    prompt = FORM_FEEDBACK_PROMPT.format(
-        exercise_name=exercise_name,
-        joint_angles=json.dumps(joint_angles, indent=2),
-        range_of_motion=json.dumps(range_of_motion, indent=2),
-        form_cues=cues
-    )
+    prompt = _build_form_prompt(exercise_name, joint_angles, range_of_motion)
 
     response = client.models.generate_content(
         model=settings.GEMINI_ANALYSIS_MODEL,
@@ -286,20 +409,46 @@ def analyze_form_with_pose_data(
         )
     )
 
-    try:
-        text = response.text.strip()
-        if text.startswith("```"):
-            text = text.split("```")[1]
-            if text.startswith("json"):
-                text = text[4:]
-        return json.loads(text)
-    except json.JSONDecodeError:
-        return {
-            "score": 75,
-            "good_points": [],
-            "issues": [],
-            "tips": [response.text.strip()]
-        }
+    return _parse_form_feedback(response.text)
+
+
+# ============================================================
+# Batch Mode
+# ============================================================
+
+BATCH_POLL_INTERVAL_SEC = 10
+BATCH_DONE_STATES = {
+    "JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED",
+    "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"
+}
+
+
+def run_inline_batch(inline_requests: list[dict], display_name: str) -> list[Optional[str]]:
+    """
+    Submit inline requests as one Gemini Batch Mode job and wait for it.
+    Returns response texts in request order (None for failed requests).
+    """
+    client = get_client()
+
+    job = client.batches.create(
+        model=settings.GEMINI_ANALYSIS_MODEL,
+        src=inline_requests,
+        config={"display_name": display_name}
+    )
+    print(f"[Gemini] Submitted batch job {job.name} ({len(inline_requests)} requests)")
+
+    while job.state.name not in BATCH_DONE_STATES:
+        time.sleep(BATCH_POLL_INTERVAL_SEC)
+        job = client.batches.get(name=job.name)
+
+    if job.state.name != "JOB_STATE_SUCCEEDED":
+        print(f"[Gemini] Batch job {job.name} ended with {job.state.name}")
+        return [None] * len(inline_requests)
+
+    return [
+        r.response.text if r.response and r.response.text else None
+        for r in job.dest.inlined_responses
+    ]
 
 
 def generate_workout_insights(exercises: list[ExerciseSegment]) -> dict:
@@ -367,31 +516,54 @@ def generate_workout_insights(exercises: list[ExerciseSegment]) -> dict:
             "recommendations": []
         }
 
+# Returned without an LLM call when there's nothing specific to tailor to
+BALANCED_RECOMMENDATIONS = [
+    "Keep your current split and progressively add load to your main lifts",
+    "Add a unilateral movement such as lunges or single-arm rows",
+    "Include one core exercise like planks or ab wheel rollouts",
+]
+
+
 def generate_recommendations(
         muscle_activation: dict[str, float],
         recent_exercises: list[str],
         goals: list[str] = None
 ) -> list[str]:
     """Generate exercise recommendations based on training patterns."""
-    client = get_client()
-
     # Find undertrained muscles
     undertrained = [m for m, v in muscle_activation.items() if v < 0.3]
 
-    prompt = f"""
-    Based on this training data, suggest 3-5 exercises to add to future workouts.
+    if not undertrained and not goals:
+        return list(BALANCED_RECOMMENDATIONS)
 
-    Undertrained muscles: {', '.join(undertrained) if undertrained else 'None identified'}
-    Recent exercises: {', '.join(recent_exercises[:10])}
-    Training goals: {', '.join(goals) if goals else 'General fitness'}
+    # The prompt only depends on these, so identical inputs reuse the last answer
+    # until the TTL bucket rolls over
+    return list(_generate_recommendations_cached(
+        tuple(undertrained),
+        tuple(recent_exercises[:10]),
+        tuple(goals or ()),
+        int(time.time() // RECOMMENDATIONS_TTL_SEC)
+    ))
 
-    Provide specific exercise recommendations that would:
-    1. Address any muscle imbalances
-    2. Complement existing training
-    3. Align with stated goals
 
-    Format as a simple list, one exercise per line.
-    """
+RECOMMENDATIONS_TTL_SEC = 3600
+
+
+@lru_cache(maxsize=2048)
+def _generate_recommendations_cached(
+        undertrained: tuple[str, ...],
+        recent_exercises: tuple[str, ...],
+        goals: tuple[str, ...],
+        ttl_bucket: int
+) -> tuple[str, ...]:
+    client = get_client()
+
+    prompt = _fill(
+        _RECOMMENDATIONS_TEMPLATE,
+        undertrained=", ".join(undertrained) if undertrained else "None identified",
+        recent_exercises=", ".join(recent_exercises),
+        goals=", ".join(goals) if goals else "General fitness"
+    )
 
     response = client.models.generate_content(
         model=settings.GEMINI_ANALYSIS_MODEL,
@@ -409,32 +581,28 @@ def generate_recommendations(
         if line.strip() and not line.strip().startswith("#")
     ]
 
-    return recommendations[:5]
+    return tuple(recommendations[:5])
+
+
+# Points deducted per feedback note; info notes don't reduce the score
+SEVERITY_PENALTY = {"critical": 25, "warning": 10}
 
 
 def calculate_form_score(exercises: list[ExerciseSegment]) -> float:
-    """Calculate overall form score from exercise feedback."""
+    """
+    Calculate overall form score from exercise feedback.
+    Each exercise starts at 100 and loses points per warning/critical note (floored at 0);
+    the workout score is the mean across exercises.
+    """
     if not exercises:
         return 100.0
 
-    total_points = 0
-    max_points = 0
-
-    for ex in exercises:
-        # Base score per exercise
-        ex_score = 100
-        max_points += 100
-
-        for fb in ex.form_feedback:
-            if fb.severity == "critical":
-                ex_score -= 25
-            elif fb.severity == "warning":
-                ex_score -= 10
-            # Info notes don't reduce score
-
-        total_points += max(ex_score, 0)
-
-    return (total_points / max_points * 100) if max_points > 0 else 100.0
+    penalty = SEVERITY_PENALTY.get
+    total_points = sum(
+        max(100 - sum(penalty(fb.severity, 0) for fb in ex.form_feedback), 0)
+        for ex in exercises
+    )
+    return total_points / len(exercises)
 
 
 # ============================================================
@@ -1,7 +1,9 @@
 import os
 import random
+import numpy as np
 from datetime import datetime, timedelta
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from bson import ObjectId
 import sys
 from dotenv import load_dotenv
 
@@ -27,6 +29,8 @@ except ImportError as e:
 NUM_USERS = 20
 WORKOUTS_PER_USER = 5
 DAYS_BACK = 60
+BATCH_SIZE = 500  # workouts per insert_many
+MAX_EXERCISES_PER_WORKOUT = 6
 
 # Mock Data Constants
 EXERCISES = [
@@ -50,11 +54,23 @@ def clear_database():
 def generate_users():
     """Generate mock users."""
     print(f"Generating {NUM_USERS} users...")
+    emails = [f"user{i}@mock.com" for i in range(NUM_USERS)]
+
+    # Look up all existing mock users in one query
+    existing = {
+        doc["email"]: doc
+        for doc in users_collection().find({"email": {"$in": emails}})
+    }
+
     users = []
-    
-    for i in range(NUM_USERS):
+    new_docs = []
+    for i, email in enumerate(emails):
+        if email in existing:
+            users.append(existing[email])
+            continue
+
         user_doc = {
-            "email": f"user{i}@mock.com",
+            "email": email,
             "name": f"Mock User {i}",
             "password_hash": "$2b$12$EixZaYVK1fsbw1ZfbX3OXePaWxwKc.6q2Vs.H1g9E0E9B/Z/Z/Z/.", # hash for "password" (dummy)
             "created_at": datetime.utcnow() - timedelta(days=random.randint(1, DAYS_BACK)),
@@ -66,26 +82,39 @@ def generate_users():
             "total_duration_min": 0,
             "registration_complete": True
         }
-        
-        # Check if user exists
-        existing = users_collection().find_one({"email": user_doc["email"]})
-        if not existing:
-            result = users_collection().insert_one(user_doc)
-            user_doc["_id"] = str(result.inserted_id)
-            users.append(user_doc)
-        else:
-            existing["_id"] = str(existing["_id"])
-            users.append(existing)
-            
+        new_docs.append(user_doc)
+        users.append(user_doc)
+
+    # insert_many fills in each new doc's _id
+    if new_docs:
+        users_collection().insert_many(new_docs)
+
+    for user in users:
+        user["_id"] = str(user["_id"])
+
     return users
 
 def generate_workouts(users):
     """Generate workouts for users."""
     print("Generating workouts...")
     
+    # Pre-sample muscle activations for the maximum number of exercises in one go.
+    # Two distinct muscles per exercise: offset the second index by 1..len-1.
+    rng = np.random.default_rng()
+    max_exercises = NUM_USERS * WORKOUTS_PER_USER * MAX_EXERCISES_PER_WORKOUT
+    first = rng.integers(len(MUSCLES), size=max_exercises)
+    second = (first + rng.integers(1, len(MUSCLES), size=max_exercises)) % len(MUSCLES)
+    muscle_pairs = np.stack([first, second], axis=1).tolist()
+    muscle_values = rng.uniform(0.6, 0.95, size=(max_exercises, 2)).tolist()
+    sample_idx = 0
+
     count = 0
+    workouts_batch = []
+    user_ops = []
     for user in users:
         num_workouts = random.randint(1, WORKOUTS_PER_USER)
+        user_workouts = 0
+        user_duration = 0
         
         for _ in range(num_workouts):
             date = datetime.utcnow() - timedelta(days=random.randint(0, DAYS_BACK))
@@ -95,16 +124,16 @@ def generate_workouts(users):
             exercises = []
             muscle_accum = {}
             
-            for _ in range(random.randint(3, 6)):
+            for _ in range(random.randint(3, MAX_EXERCISES_PER_WORKOUT)):
                 ex_name = random.choice(EXERCISES)
                 
                 # Mock muscle activation for this exercise
                 activation = {}
-                primary = random.sample(MUSCLES, 2)
-                for m in primary:
-                    val = random.uniform(0.6, 0.95)
+                for m_idx, val in zip(muscle_pairs[sample_idx], muscle_values[sample_idx]):
+                    m = MUSCLES[m_idx]
                     activation[m] = val
                     muscle_accum[m] = muscle_accum.get(m, 0) + val
+                sample_idx += 1
                 
                 # Mock range of motion
                 rom = {}
@@ -144,24 +173,31 @@ def generate_workouts(users):
                 "summary": "Mock workout summary."
             }
             
-            workouts_collection().insert_one(workout_doc)
+            workouts_batch.append(workout_doc)
             count += 1
-            
-            # Update user stats
-            users_collection().update_one(
-                {"_id": user["_id"]}, # PyMongo needs ObjectId if stored as such, but here we saved str in list. 
-                                      # Wait, get_database returns collection where _id is ObjectId usually.
-                                      # For the update to work we might need to cast to ObjectId if the original doc has it.
-                                      # However, our generate_users inserted it, so we know the ID format on insertion.
-                                      # Let's simple increment counters.
-                {
-                   "$inc": {
-                       "total_workouts": 1,
-                       "total_duration_min": duration_min
-                   }
-                }
-            )
-            
+            user_workouts += 1
+            user_duration += duration_min
+
+            if len(workouts_batch) >= BATCH_SIZE:
+                workouts_collection().insert_many(workouts_batch, ordered=False)
+                workouts_batch = []
+
+        # One stats update per user instead of one per workout
+        user_ops.append(UpdateOne(
+            {"_id": ObjectId(user["_id"])},
+            {
+               "$inc": {
+                   "total_workouts": user_workouts,
+                   "total_duration_min": user_duration
+               }
+            }
+        ))
+
+    if workouts_batch:
+        workouts_collection().insert_many(workouts_batch, ordered=False)
+    if user_ops:
+        users_collection().bulk_write(user_ops, ordered=False)
+
     print(f"Generated {count} workouts.")
 
 if __name__ == "__main__":
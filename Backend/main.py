@@ -3,15 +3,29 @@ GymIntel FastAPI Backend
 Main API server with video processing and AI coaching.
 """
 import asyncio
+import json
+import multiprocessing
 import os
+import shutil
 import tempfile
+import threading
+import time
 import uuid
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from contextlib import asynccontextmanager
-from datetime import datetime
-from typing import Optional
-from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks, Form
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Mapping, Optional
+from urllib.parse import urlparse
+from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks, Form, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
+from pymongo.errors import DuplicateKeyError
 
 from config import settings
 from models import (
@@ -20,21 +34,18 @@ from models import (
 )
 from database import (
     init_database, close_connection,
-    create_user, get_user, get_user_by_email, update_user,
+    create_user, get_or_create_user, get_user, get_user_by_email, update_user,
     create_workout, get_workout, update_workout, update_workout_status,
-    get_user_workouts, get_recent_workouts,
-    get_muscle_activation_history, get_exercise_frequency,
-    get_form_issues_summary, get_avg_form_score, increment_user_stats
+    get_user_workouts, WORKOUT_LIST_PROJECTION, get_dashboard_bundle, get_user_window_stats,
+    get_public_stats_bundle, PUBLIC_PERCENTILE_POINTS,
+    increment_user_stats
 )
-from muscle_map import calculate_session_activation, analyze_muscle_balance
+from muscle_map import analyze_muscle_balance
 from twelvelabs_service import process_workout_video, get_or_create_index
-from gemini_service import generate_workout_summary, calculate_form_score, generate_workout_insights
-from coach_service import CoachService
+from gemini_service import generate_workout_summary, generate_workout_insights
+from coach_service import CoachService, RedisCoachHistory, simple_history
 
 from passlib.context import CryptContext
-from datetime import datetime, timedelta
-from typing import Optional
-from pydantic import BaseModel
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -79,33 +90,220 @@ class ComparisonResponse(BaseModel):
 
 
 # ============================================================
-# Processing Status Tracking (In-memory, use Redis in production)
+# Bounded In-memory Caches
+# ============================================================
+
+class ExpiringLRU:
+    """
+    Thread-safe dict-like cache bounded by size and idle time.
+    Reads and writes refresh an entry's expiry, so LRU order is also expiry
+    order and expired entries are purged from the front on each write.
+    """
+
+    def __init__(self, maxsize: int, ttl_sec: float):
+        self.maxsize = maxsize
+        self.ttl_sec = ttl_sec
+        self._data: OrderedDict = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            now = time.monotonic()
+            if entry[0] <= now:
+                del self._data[key]
+                return default
+            self._data[key] = (now + self.ttl_sec, entry[1])
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._store(key, value, time.monotonic())
+
+    def setdefault(self, key, value):
+        """Return the live entry for key, or store and return value, atomically."""
+        with self._lock:
+            now = time.monotonic()
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                value = entry[1]
+            self._store(key, value, now)
+            return value
+
+    def _store(self, key, value, now: float):
+        """Insert/refresh key and purge expired or excess entries (caller holds the lock)."""
+        self._data[key] = (now + self.ttl_sec, value)
+        self._data.move_to_end(key)
+        while self._data:
+            oldest_key, (expires_at, _) = next(iter(self._data.items()))
+            if expires_at > now and len(self._data) <= self.maxsize:
+                break
+            del self._data[oldest_key]
+
+    def __contains__(self, key) -> bool:
+        return self.get(key) is not None
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# ============================================================
+# Processing Status Tracking (In-memory, or Redis when REDIS_URL is set)
 # ============================================================
 
+# Shared read-only payloads: polling returns these without allocating per request
+UNKNOWN_STATUS: Mapping[str, Any] = MappingProxyType({
+    "status": "unknown",
+    "progress": 0,
+    "message": "Status not found"
+})
+
+
+class StatusNotifier:
+    """
+    Wakes WebSocket status subscribers in this process when a workout's status is set.
+    notify() is safe to call from worker threads; in pool processes (no bound loop)
+    it is a no-op and subscribers fall back to re-reading the status periodically.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._waiters: dict[str, set[asyncio.Event]] = {}
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def subscribe(self, workout_id: str) -> asyncio.Event:
+        event = asyncio.Event()
+        self._waiters.setdefault(workout_id, set()).add(event)
+        return event
+
+    def unsubscribe(self, workout_id: str, event: asyncio.Event):
+        waiters = self._waiters.get(workout_id)
+        if waiters is not None:
+            waiters.discard(event)
+            if not waiters:
+                del self._waiters[workout_id]
+
+    def notify(self, workout_id: str):
+        if self._loop is not None and workout_id in self._waiters:
+            self._loop.call_soon_threadsafe(self._wake, workout_id)
+
+    def _wake(self, workout_id: str):
+        for event in self._waiters.get(workout_id, ()):
+            event.set()
+
+
+status_notifier = StatusNotifier()
+
+
 class ProcessingStatus:
     def __init__(self):
-        self.statuses: dict[str, dict] = {}
+        # Finished statuses age out instead of accumulating forever
+        self.statuses = ExpiringLRU(maxsize=50_000, ttl_sec=900)
 
     def set(self, workout_id: str, status: str, progress: int, message: str = ""):
-        self.statuses[workout_id] = {
+        # Built once per update; every poll until the next update shares it
+        self.statuses[workout_id] = MappingProxyType({
             "status": status,
             "progress": progress,
             "message": message,
             "updated_at": datetime.utcnow().isoformat()
-        }
+        })
+        status_notifier.notify(workout_id)
+
+    def get(self, workout_id: str) -> Mapping[str, Any]:
+        return self.statuses.get(workout_id, UNKNOWN_STATUS)
 
-    def get(self, workout_id: str) -> dict:
-        return self.statuses.get(workout_id, {
-            "status": "unknown",
-            "progress": 0,
-            "message": "Status not found"
+    def clear(self, workout_id: str):
+        self.statuses.pop(workout_id)
+
+
+class RedisProcessingStatus:
+    """Processing status shared across workers via Redis hashes (ws:{workout_id})."""
+
+    TTL_SEC = 3600
+
+    def __init__(self, url: str):
+        import redis
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+
+    def _key(self, workout_id: str) -> str:
+        return f"ws:{workout_id}"
+
+    def set(self, workout_id: str, status: str, progress: int, message: str = ""):
+        key = self._key(workout_id)
+        # HSET + EXPIRE in one round-trip
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(key, mapping={
+            "status": status,
+            "progress": progress,
+            "message": message,
+            "updated_at": datetime.utcnow().isoformat()
         })
+        pipe.expire(key, self.TTL_SEC)
+        pipe.execute()
+        status_notifier.notify(workout_id)
+
+    def get(self, workout_id: str) -> Mapping[str, Any]:
+        data = self.redis.hgetall(self._key(workout_id))
+        if not data:
+            return UNKNOWN_STATUS
+        data["progress"] = int(data.get("progress", 0))
+        return data
 
     def clear(self, workout_id: str):
-        if workout_id in self.statuses:
-            del self.statuses[workout_id]
+        self.redis.delete(self._key(workout_id))
+
+
+# Redis when configured (needed with multiple workers), in-memory otherwise
+processing_status = (
+    RedisProcessingStatus(settings.REDIS_URL) if settings.REDIS_URL else ProcessingStatus()
+)
+
+
+# ============================================================
+# Response Serialization
+# ============================================================
+
+def model_response(model: BaseModel) -> Response:
+    """
+    Send an already-trusted model as JSON. Returning a Response bypasses the
+    route's response_model re-validation; the model still documents the schema.
+    """
+    return Response(model.model_dump_json(), media_type="application/json")
+
+
+WORKOUT_JSON_CACHE_SIZE = 4096
+
+# (workout_id, updated_at) -> JSON bytes. Every write bumps updated_at,
+# so an edited workout misses the cache instead of serving a stale entry.
+_workout_json: OrderedDict[tuple[Optional[str], datetime], bytes] = OrderedDict()
+
 
-processing_status = ProcessingStatus()
+def workout_json(workout: Workout) -> bytes:
+    """Serialize a workout with pydantic-core, reusing the bytes while it hasn't changed."""
+    key = (workout.id, workout.updated_at)
+    cached = _workout_json.get(key)
+    if cached is not None:
+        _workout_json.move_to_end(key)
+        return cached
+
+    data = workout.model_dump_json().encode()
+    _workout_json[key] = data
+    if len(_workout_json) > WORKOUT_JSON_CACHE_SIZE:
+        _workout_json.popitem(last=False)
+    return data
 
 
 # ============================================================
@@ -116,7 +314,32 @@ processing_status = ProcessingStatus()
 async def lifespan(app: FastAPI):
     """Handle startup and shutdown events."""
     print("Starting GymIntel API...")
+    # Bounded pool behind asyncio.to_thread for the blocking DB/SDK calls
+    executor = ThreadPoolExecutor(
+        max_workers=settings.API_THREAD_POOL_SIZE,
+        thread_name_prefix="gymintel-io"
+    )
+    asyncio.get_running_loop().set_default_executor(executor)
+    app.state.executor = executor
+    status_notifier.bind(asyncio.get_running_loop())
+
+    # Video analysis gets its own bounded pool so a burst of uploads queues there
+    # instead of tying up the threads that serve requests
+    global _video_pool
+    if settings.VIDEO_PROCESS_WORKERS > 0:
+        _video_pool = ProcessPoolExecutor(
+            max_workers=settings.VIDEO_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    else:
+        _video_pool = ThreadPoolExecutor(
+            max_workers=settings.VIDEO_THREAD_WORKERS,
+            thread_name_prefix="gymintel-video"
+        )
+
     init_database()
+    # Prime the demo user id so the first 'undefined' request doesn't pay for the lookup
+    get_demo_user_id()
 
     # Create default index for TwelveLabs
     try:
@@ -127,12 +350,16 @@ async def lifespan(app: FastAPI):
     yield
     print("Shutting down...")
     close_connection()
+    executor.shutdown(wait=False)
+    _video_pool.shutdown(wait=False, cancel_futures=True)
+
 
+API_VERSION = "1.0.0"
 
 app = FastAPI(
     title="GymIntel API",
     description="AI-Powered Workout Intelligence Platform",
-    version="1.0.0",
+    version=API_VERSION,
     lifespan=lifespan
 )
 
@@ -145,6 +372,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Dashboard/workout JSON repeats the same muscle and exercise keys and compresses
+# well; small bodies (health checks, statuses) go out uncompressed
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 
 # ============================================================
 # Request/Response Models
@@ -175,17 +406,56 @@ class ChatResponse(BaseModel):
     user_id: str
 
 
+# ============================================================
+# Demo User
+# ============================================================
+
+DEMO_USER_EMAIL = "undefined@demo.gymintel.com"
+
+# Resolved once per process. While the demo user doesn't exist yet, the lookup is
+# retried at most once per DEMO_USER_MISS_TTL_SEC instead of on every request.
+DEMO_USER_MISS_TTL_SEC = 60
+_demo_user_id: Optional[str] = None
+_demo_user_checked_at = float("-inf")
+
+
+def get_demo_user_id(force: bool = False) -> Optional[str]:
+    """
+    Id of the demo user that 'undefined' requests map to (cached after the first hit).
+    `force` skips the negative cache, for callers about to create the user.
+    """
+    global _demo_user_id, _demo_user_checked_at
+    if _demo_user_id is None:
+        now = time.monotonic()
+        if force or now - _demo_user_checked_at >= DEMO_USER_MISS_TTL_SEC:
+            _demo_user_checked_at = now
+            demo_user = get_user_by_email(DEMO_USER_EMAIL)
+            if demo_user:
+                _demo_user_id = demo_user.id
+    return _demo_user_id
+
+
+def remember_created_user(email: str, user_id: str):
+    """Record the demo user's id as soon as it's created."""
+    global _demo_user_id
+    if email == DEMO_USER_EMAIL:
+        _demo_user_id = user_id
+
+
+def resolve_user_id(user_id: str) -> str:
+    """Map the frontend's 'undefined' placeholder to the demo user."""
+    if user_id == "undefined":
+        return get_demo_user_id() or user_id
+    return user_id
+
+
 # ============================================================
 # User Endpoints
 # ============================================================
 
 @app.post("/api/users", response_model=dict)
 async def api_create_user(request: CreateUserRequest):
-    """Create a new user."""
-    existing = get_user_by_email(request.email)
-    if existing:
-        return {"user_id": existing.id, "message": "User already exists"}
-
+    """Create a new user (returns the existing one for a known email)."""
     user = User(
         email=request.email,
         name=request.name,
@@ -193,26 +463,30 @@ async def api_create_user(request: CreateUserRequest):
         goals=request.goals,
     )
 
-    user_id = create_user(user)
+    user_id, created = await asyncio.to_thread(get_or_create_user, user)
+    if not created:
+        return {"user_id": user_id, "message": "User already exists"}
+
+    remember_created_user(request.email, user_id)
     return {"user_id": user_id, "message": "User created successfully"}
 
 
 @app.get("/api/users/{user_id}")
 async def api_get_user(user_id: str):
     """Get user profile."""
-    user = get_user(user_id)
+    user = await asyncio.to_thread(get_user, user_id)
     if not user:
         raise HTTPException(404, "User not found")
-    return user.model_dump()
+    return model_response(user)
 
 
 @app.get("/api/users/email/{email}")
 async def api_get_user_by_email(email: str):
     """Get user by email."""
-    user = get_user_by_email(email)
+    user = await asyncio.to_thread(get_user_by_email, email)
     if not user:
         raise HTTPException(404, "User not found")
-    return user.model_dump()
+    return model_response(user)
 
 
 @app.put("/api/users/{user_id}")
@@ -222,7 +496,7 @@ async def api_update_user(user_id: str, request: UpdateUserRequest):
     if not updates:
         return {"message": "No updates provided"}
 
-    success = update_user(user_id, updates)
+    success = await asyncio.to_thread(update_user, user_id, updates)
     if not success:
         raise HTTPException(404, "User not found")
 
@@ -233,32 +507,38 @@ async def api_update_user(user_id: str, request: UpdateUserRequest):
 # Workout Upload & Processing
 # ============================================================
 
-@app.post("/api/workouts/upload", response_model=UploadWorkoutResponse)
-async def api_upload_workout(
-    background_tasks: BackgroundTasks,
-    user_id: str = Form(...),
-    file: UploadFile = File(None),
-    video_url: str = Form(None)
-):
-    """
-    Upload a workout video for analysis.
-    """
-    # Create copy of user_id to modify cleanly
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+
+def _filename_from_url(video_url: Optional[str]) -> str:
+    """Name a URL upload after its path, ignoring any query string or fragment."""
+    if not video_url:
+        return "video"
+    return os.path.basename(urlparse(video_url).path) or "video"
+
+
+def _save_upload(src, suffix: str) -> str:
+    """Copy an upload's spooled file to a named temp file in fixed-size chunks."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        shutil.copyfileobj(src, tmp, UPLOAD_CHUNK_SIZE)
+        return tmp.name
+
+
+def _resolve_upload_user(user_id: str) -> str:
+    """Id of the user an upload belongs to, falling back to (and creating) a demo user."""
     target_user_id = user_id
 
     # Handle 'undefined' or missing user cases
     if not target_user_id or target_user_id == "undefined":
-         demo_email = "undefined@demo.gymintel.com"
-         existing = get_user_by_email(demo_email)
-         if existing:
-             target_user_id = existing.id
-         else:
+         target_user_id = get_demo_user_id(force=True)
+         if not target_user_id:
              user = User(
-                email=demo_email,
+                email=DEMO_USER_EMAIL,
                 name="Demo User",
                 experience_level="intermediate",
             )
              target_user_id = create_user(user)
+             remember_created_user(DEMO_USER_EMAIL, target_user_id)
              print(f"[API] Created NEW demo user: {target_user_id}")
     else:
         # Validate provided ID exists
@@ -278,18 +558,34 @@ async def api_upload_workout(
                 )
                  target_user_id = create_user(user)
 
+    return target_user_id
+
+
+@app.post("/api/workouts/upload", response_model=UploadWorkoutResponse)
+async def api_upload_workout(
+    background_tasks: BackgroundTasks,
+    user_id: str = Form(...),
+    file: UploadFile = File(None),
+    video_url: str = Form(None)
+):
+    """
+    Upload a workout video for analysis.
+    """
+    # User lookups (and the demo-user fallback) hit Mongo, so run them off the loop
+    target_user_id = await asyncio.to_thread(_resolve_upload_user, user_id)
+
     if not file and not video_url:
         raise HTTPException(400, "Either file or video_url must be provided")
 
     # Create workout record attached to the TARGET user id
     workout = Workout(
         user_id=target_user_id,
-        video_filename=file.filename if file else (video_url.split("/")[-1] if video_url else "video"),
+        video_filename=(file.filename or "video") if file else _filename_from_url(video_url),
         video_url=video_url,
         status=WorkoutStatus.PENDING
     )
 
-    workout_id = create_workout(workout)
+    workout_id = await asyncio.to_thread(create_workout, workout)
     print(f"[API] Created workout {workout_id} for user {target_user_id}")
 
     # Initialize status
@@ -298,11 +594,10 @@ async def api_upload_workout(
     # Process in background
     if file:
         # Save file temporarily
-        suffix = os.path.splitext(file.filename)[1] if file.filename else ".mp4"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            content = await file.read()
-            tmp.write(content)
-            tmp_path = tmp.name
+        suffix = os.path.splitext(file.filename or "")[1] or ".mp4"
+        # Plain blocking copy in a worker thread: the whole video is never held in
+        # memory, and there is no per-chunk await on the event loop
+        tmp_path = await asyncio.to_thread(_save_upload, file.file, suffix)
 
         background_tasks.add_task(
             process_workout_background,
@@ -311,6 +606,8 @@ async def api_upload_workout(
             file_path=tmp_path,
         )
     else:
+        # The URL is handed to TwelveLabs as-is and fetched on their side;
+        # the API process never downloads or stats it
         background_tasks.add_task(
             process_workout_background,
             workout_id=workout_id,
@@ -318,105 +615,100 @@ async def api_upload_workout(
             video_url=video_url,
         )
 
-    return UploadWorkoutResponse(
+    return model_response(UploadWorkoutResponse.model_construct(
         workout_id=workout_id,
         status=WorkoutStatus.PROCESSING,
         message="Video upload started. Processing in background."
-    )
+    ))
 
 
-def process_workout_background(
+async def _generate_insights_safe(exercises) -> Optional[dict]:
+    """Run the Gemini insights call off the event loop; None if it fails."""
+    try:
+        return await asyncio.to_thread(generate_workout_insights, exercises)
+    except Exception as e:
+        print(f"[API] Error generating insights: {e}")
+        return None
+
+
+# Set in lifespan: worker processes when VIDEO_PROCESS_WORKERS > 0, otherwise
+# VIDEO_THREAD_WORKERS threads separate from the request-serving pool
+_video_pool: Optional[Executor] = None
+
+
+def _process_video_job(workout_id: str, video_kwargs: dict) -> dict:
+    """Run process_workout_video on the video pool, reporting progress via processing_status."""
+    def on_status(msg: str, pct: int):
+        processing_status.set(workout_id, "processing", pct, msg)
+
+    return process_workout_video(workout_id=workout_id, on_status=on_status, **video_kwargs)
+
+
+async def process_workout_background(
     workout_id: str,
     user_id: str,
     file_path: str = None,
     video_url: str = None,
 ):
-    """Background task to process workout video."""
+    """
+    Background task to process workout video.
+    Blocking SDK and DB calls run in worker threads so the event loop stays free;
+    the video analysis itself runs on the dedicated video pool.
+    """
     try:
         # Update status
-        update_workout_status(workout_id, WorkoutStatus.PROCESSING)
+        await asyncio.to_thread(update_workout_status, workout_id, WorkoutStatus.PROCESSING)
         processing_status.set(workout_id, "processing", 5, "Starting video processing...")
 
-        def on_status(msg: str, pct: int):
-            processing_status.set(workout_id, "processing", pct, msg)
-
         # Process video with TwelveLabs + MediaPipe
-        # This step now saves the exercises and muscle activation to DB
-        result = process_workout_video(
+        # This step now saves the exercises and muscle activation to DB.
+        # The index id is resolved in the pool (memoized after startup) rather
+        # than with a blocking call here on the event loop.
+        video_kwargs = dict(
             file_path=file_path,
             video_url=video_url,
-            index_id=get_or_create_index(settings.TWELVELABS_INDEX_NAME),
             user_id=user_id,
-            workout_id=workout_id,
-            on_status=on_status,
             analyze_form_deeply=True
         )
+        result = await asyncio.get_running_loop().run_in_executor(
+            _video_pool, _process_video_job, workout_id, video_kwargs
+        )
 
         processing_status.set(workout_id, "analyzing", 95, "Generating insights...")
 
         # Generate AI insights using Gemini
         exercises = result["exercises"]
-
-        # Calculate aggregated muscle activation
-        exercise_data = [{"name": ex.name, "duration_sec": ex.duration_sec, "reps": ex.reps, "weight_kg": ex.weight_kg, "avg_quality_score": ex.avg_quality_score} for ex in exercises]
-        muscle_activation = calculate_session_activation(exercise_data)
-
-        # Calculate totals for summary
-        primary = [m for m, v in sorted(muscle_activation.items(), key=lambda x: -x[1]) if v > 0.3][:3]
-        secondary = [m for m, v in sorted(muscle_activation.items(), key=lambda x: -x[1]) if 0.1 < v <= 0.3][:3]
-
-        # Calculate form score
-        form_score = calculate_form_score(exercises)
-
-        try:
-             insights = generate_workout_insights(exercises)
-
-             # Final update with insights and muscle activation
-             update_workout(workout_id, {
-                 "summary": insights.get("summary"),
-                 "insights": insights.get("insights", []),
-                 "recommendations": insights.get("recommendations", []),
-                 "status": WorkoutStatus.COMPLETE,
-                 "muscle_activation": {
-                    "muscles": muscle_activation,
-                    "primary_muscles": primary,
-                    "secondary_muscles": secondary
-                 },
-                 "form_score": form_score
-                 # exercises are already saved by process_workout_video?
-                 # Wait, process_workout_video returns a dict but does it save?
-                 # Let's verify twelvelabs_service.py. Assuming it does NOT save to DB fully or we want to overwrite to be safe.
-                 # Actually, we should save exercises here to be sure.
-             })
-        except Exception as e:
-             print(f"[API] Error generating insights: {e}")
-             # Ensure we still mark as complete even if insights fail
-             update_workout_status(workout_id, WorkoutStatus.COMPLETE)
+        insights = await _generate_insights_safe(exercises)
+
+        # The pipeline already stored exercises, muscle activation (primary/secondary
+        # picked in one sorted pass), form score and COMPLETE status for this
+        # workout_id, so only the insights are left to write
+        if insights is not None:
+            await asyncio.to_thread(update_workout, workout_id, {
+                "summary": insights.get("summary"),
+                "insights": insights.get("insights", []),
+                "recommendations": insights.get("recommendations", [])
+            })
 
         processing_status.set(workout_id, "complete", 100, "Analysis complete!")
         print(f"[API] Workout processing complete: {workout_id}")
-
-        # Cleanup uploaded file if needed
-        if file_path and os.path.exists(file_path) and "test_videos" not in file_path:
-             try:
-                 os.remove(file_path)
-             except:
-                 pass
+        invalidate_dashboard(user_id)
+        invalidate_public_stats()
 
     except Exception as e:
         print(f"[API] Error processing workout: {e}")
-        update_workout(workout_id, {
+        await asyncio.to_thread(update_workout, workout_id, {
             "status": WorkoutStatus.FAILED,
             "error_message": str(e)
         })
         processing_status.set(workout_id, "failed", 0, str(e))
     finally:
-        # Clean up temp file
-        if file_path and os.path.exists(file_path):
+        # The only cleanup path for the uploaded temp file (never the bundled test videos)
+        if file_path and "test_videos" not in file_path:
             try:
-                os.unlink(file_path)
+                Path(file_path).unlink(missing_ok=True)
                 print(f"[API] Cleaned up temp file: {file_path}")
-            except Exception as e:
+            except OSError as e:
                 print(f"[API] Error cleaning up temp file: {e}")
 
 
@@ -424,16 +716,40 @@ def process_workout_background(
 # Workout Status & Results
 # ============================================================
 
+# Statuses after which a workout's processing status never changes
+TERMINAL_STATUSES = frozenset({"complete", "failed"})
+
+
 @app.get("/api/workouts/{workout_id}/status")
 async def api_get_workout_status(workout_id: str):
-    """Get workout processing status (for polling)."""
-    # First check in-memory status
-    status = processing_status.get(workout_id)
+    """Get workout processing status (for polling; /ws/workouts/{id}/status pushes it instead)."""
+    status = await asyncio.to_thread(processing_status.get, workout_id)
+    if status["status"] in TERMINAL_STATUSES:
+        # Nothing changes after complete/failed, so the live status answers on its own
+        return {
+            "workout_id": workout_id,
+            "status": status["status"],
+            "progress": status["progress"],
+            "message": status["message"],
+            "db_status": status["status"],
+            "error": status["message"] if status["status"] == "failed" else None
+        }
 
-    # Also check database
-    workout = get_workout(workout_id)
+    workout = await asyncio.to_thread(get_workout, workout_id)
     if workout:
-        db_status = workout.status.value if hasattr(workout.status, 'value') else workout.status
+        # Stored documents carry the plain string; only the model default is an enum member
+        db_status = workout.status.value if isinstance(workout.status, WorkoutStatus) else workout.status
+        if status is UNKNOWN_STATUS and db_status in TERMINAL_STATUSES:
+            # Finished before this process saw it (restart, expiry): remember it so
+            # further polls skip the database
+            status = {
+                "status": db_status,
+                "progress": 100 if db_status == "complete" else 0,
+                "message": workout.error_message or ""
+            }
+            await asyncio.to_thread(
+                processing_status.set, workout_id, db_status, status["progress"], status["message"]
+            )
         return {
             "workout_id": workout_id,
             "status": status.get("status", db_status),
@@ -449,49 +765,174 @@ async def api_get_workout_status(workout_id: str):
     }
 
 
+# Re-read interval for updates this process isn't notified of (other workers, pool processes)
+STATUS_PUSH_FALLBACK_SEC = 2.0
+
+
+@app.websocket("/ws/workouts/{workout_id}/status")
+async def ws_workout_status(websocket: WebSocket, workout_id: str):
+    """Push processing status on every change until the workout completes or fails."""
+    await websocket.accept()
+    changed = status_notifier.subscribe(workout_id)
+    try:
+        last = None
+        stored_sent = False
+        while True:
+            changed.clear()
+            status = await asyncio.to_thread(processing_status.get, workout_id)
+            if status is UNKNOWN_STATUS:
+                if not stored_sent:
+                    # No live progress (expired, running on another worker without Redis, or
+                    # a crashed job): report the stored state once, then only wait for live updates
+                    workout = await asyncio.to_thread(get_workout, workout_id)
+                    db_status = "unknown"
+                    if workout:
+                        db_status = workout.status.value if isinstance(workout.status, WorkoutStatus) else workout.status
+                    await websocket.send_json({
+                        "workout_id": workout_id,
+                        "status": db_status,
+                        "progress": 100 if db_status == "complete" else 0,
+                        "message": (workout.error_message or "") if workout else "Workout not found"
+                    })
+                    stored_sent = True
+                    if not workout or db_status in TERMINAL_STATUSES:
+                        break
+            elif status != last:
+                await websocket.send_json({"workout_id": workout_id, **status})
+                last = status
+                if status.get("status") in TERMINAL_STATUSES:
+                    break
+
+            try:
+                await asyncio.wait_for(changed.wait(), STATUS_PUSH_FALLBACK_SEC)
+            except asyncio.TimeoutError:
+                pass
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        status_notifier.unsubscribe(workout_id, changed)
+
+
 @app.get("/api/workouts/{workout_id}")
 async def api_get_workout(workout_id: str):
     """Get workout details and analysis."""
-    workout = get_workout(workout_id)
+    workout = await asyncio.to_thread(get_workout, workout_id)
     if not workout:
         raise HTTPException(404, "Workout not found")
-    return workout.model_dump()
+    # Already JSON; skip FastAPI's jsonable_encoder pass
+    return Response(workout_json(workout), media_type="application/json")
+
+
+def workout_summary(workout: Workout) -> dict:
+    """Compact JSON-native view of a workout for list/preview responses."""
+    return {
+        "id": workout.id,
+        "date": workout.created_at.isoformat() if workout.created_at else None,
+        "exercises": [e.name for e in workout.exercises] if workout.exercises else [],
+        "duration_min": workout.video_duration_sec / 60 if workout.video_duration_sec else 0,
+        "form_score": workout.form_score
+    }
 
 
 @app.get("/api/users/{user_id}/workouts")
-async def api_get_user_workouts(user_id: str, limit: int = 10, skip: int = 0):
-    """Get workouts for a user."""
+async def api_get_user_workouts(user_id: str, limit: int = 10, skip: int = 0, fields: str = "summary"):
+    """
+    Get workouts for a user.
+    Returns compact summaries by default; pass fields=full for complete workout documents.
+    """
     # Resolve 'undefined' to demo user
-    if user_id == "undefined":
-        demo_user = get_user_by_email("undefined@demo.gymintel.com")
-        if demo_user:
-            user_id = demo_user.id
+    user_id = resolve_user_id(user_id)
 
-    workouts = get_user_workouts(user_id, limit, skip)
-    return {
-        "workouts": [w.model_dump() for w in workouts],
-        "count": len(workouts)
-    }
+    if fields != "full":
+        workouts = await asyncio.to_thread(
+            get_user_workouts, user_id, limit, skip, projection=WORKOUT_LIST_PROJECTION
+        )
+        return {
+            "workouts": [{**workout_summary(w), "status": w.status} for w in workouts],
+            "count": len(workouts)
+        }
+
+    workouts = await asyncio.to_thread(get_user_workouts, user_id, limit, skip)
+    body = b'{"workouts":[%s],"count":%d}' % (
+        b",".join(workout_json(w) for w in workouts),
+        len(workouts)
+    )
+    return Response(body, media_type="application/json")
 
 
 # ============================================================
 # Dashboard Data
 # ============================================================
 
+# Served as-is for this long, then served stale while a refresh runs in the background
+DASHBOARD_FRESH_SEC = 30
+DASHBOARD_STALE_SEC = 300
+
+# user_id -> {days: (computed_at, body)}; a user's entry is dropped when one of
+# their workouts finishes processing
+_dashboard_cache = ExpiringLRU(maxsize=10_000, ttl_sec=DASHBOARD_STALE_SEC)
+_dashboard_refreshes: dict[tuple[str, int], asyncio.Task] = {}
+# user_id -> invalidation count, so a build that started before an invalidation isn't stored
+_dashboard_generations = ExpiringLRU(maxsize=10_000, ttl_sec=DASHBOARD_STALE_SEC)
+
+
+def invalidate_dashboard(user_id: str):
+    """Forget cached dashboards for a user."""
+    _dashboard_generations[user_id] = _dashboard_generations.get(user_id, 0) + 1
+    _dashboard_cache.pop(user_id)
+
+
+async def _refresh_dashboard(user_id: str, days: int) -> bytes:
+    """Build the dashboard body and store it in the cache (unless invalidated meanwhile)."""
+    generation = _dashboard_generations.get(user_id, 0)
+    body = JSONResponse(await _build_dashboard(user_id, days)).body
+    if generation != _dashboard_generations.get(user_id, 0):
+        return body
+    entries = _dashboard_cache.get(user_id)
+    if entries is None:
+        entries = {}
+        _dashboard_cache[user_id] = entries
+    entries[days] = (time.monotonic(), body)
+    return body
+
+
+async def _refresh_dashboard_quietly(user_id: str, days: int):
+    try:
+        await _refresh_dashboard(user_id, days)
+    except Exception as e:
+        print(f"[API] Dashboard refresh failed for {user_id}: {e}")
+
+
 @app.get("/api/users/{user_id}/dashboard")
 async def api_get_dashboard(user_id: str, days: int = 30):
-    """Get dashboard data for a user."""
+    """Get dashboard data for a user (stale-while-revalidate cached)."""
     # Resolve 'undefined' to demo user
-    if user_id == "undefined":
-        demo_user = get_user_by_email("undefined@demo.gymintel.com")
-        if demo_user:
-            user_id = demo_user.id
-            print(f"[API] Resolved 'undefined' dashboard request to user {user_id}")
-
-    # Get recent workouts
-    recent_workouts = get_recent_workouts(user_id, days)
-
-    if not recent_workouts:
+    user_id = resolve_user_id(user_id)
+
+    entries = _dashboard_cache.get(user_id)
+    cached = entries.get(days) if entries else None
+    if cached is not None:
+        computed_at, body = cached
+        age = time.monotonic() - computed_at
+        if age < DASHBOARD_STALE_SEC:
+            key = (user_id, days)
+            if age >= DASHBOARD_FRESH_SEC and key not in _dashboard_refreshes:
+                task = asyncio.create_task(_refresh_dashboard_quietly(user_id, days))
+                _dashboard_refreshes[key] = task
+                task.add_done_callback(lambda _: _dashboard_refreshes.pop(key, None))
+            return Response(body, media_type="application/json")
+
+    body = await _refresh_dashboard(user_id, days)
+    return Response(body, media_type="application/json")
+
+
+async def _build_dashboard(user_id: str, days: int) -> dict:
+    """Assemble the dashboard payload; every value in it is JSON-native."""
+    # One aggregation for totals, activation, frequency, form issues and the preview
+    bundle = await asyncio.to_thread(get_dashboard_bundle, user_id, days)
+
+    if not bundle["workout_count"]:
         return {
             "user_id": user_id,
             "period_days": days,
@@ -505,15 +946,9 @@ async def api_get_dashboard(user_id: str, days: int = 30):
             "recent_workouts": []
         }
 
-    # Get muscle activation history
-    activation_history = get_muscle_activation_history(user_id, days)
+    activation_history = bundle["activation_history"]
     balance_analysis = analyze_muscle_balance(activation_history) if activation_history else {}
-
-    # Get exercise frequency
-    exercise_freq = get_exercise_frequency(user_id, days)
-
-    # Get form issues
-    form_issues = get_form_issues_summary(user_id, days)
+    exercise_freq = bundle["exercise_frequency"]
 
     # Build insights
     insights = []
@@ -527,35 +962,25 @@ async def api_get_dashboard(user_id: str, days: int = 30):
         })
 
     # Add form-related insights
-    if form_issues:
-        critical_count = sum(1 for i in form_issues if i.get("severity") == "critical")
-        if critical_count > 0:
-            insights.append({
-                "type": "form",
-                "severity": "warning",
-                "message": f"You have {critical_count} critical form issue(s) to address."
-            })
+    critical_count = bundle["form_issue_counts"].get("critical", 0)
+    if critical_count > 0:
+        insights.append({
+            "type": "form",
+            "severity": "warning",
+            "message": f"You have {critical_count} critical form issue(s) to address."
+        })
 
     return {
         "user_id": user_id,
         "period_days": days,
-        "workout_count": len(recent_workouts),
-        "total_duration_min": sum(w.video_duration_sec / 60 for w in recent_workouts if w.video_duration_sec),
-        "avg_form_score": get_avg_form_score(user_id, days),
+        "workout_count": bundle["workout_count"],
+        "total_duration_min": bundle["total_duration_min"],
+        "avg_form_score": bundle["avg_form_score"],
         "muscle_balance": balance_analysis.get("muscle_totals", {}),
         "category_balance": balance_analysis.get("category_balance", {}),
         "exercise_frequency": exercise_freq,
         "insights": insights,
-        "recent_workouts": [
-            {
-                "id": w.id,
-                "date": w.created_at.isoformat() if w.created_at else None,
-                "exercises": [e.name for e in w.exercises] if w.exercises else [],
-                "duration_min": w.video_duration_sec / 60 if w.video_duration_sec else 0,
-                "form_score": w.form_score
-            }
-            for w in recent_workouts[:5]
-        ]
+        "recent_workouts": [workout_summary(w) for w in bundle["recent_workouts"]]
     }
 
 
@@ -566,15 +991,10 @@ async def api_get_dashboard(user_id: str, days: int = 30):
 @app.post("/api/auth/register")
 async def register_step1(request: RegisterRequest):
     """Step 1: Create user with email/password."""
-    from database import users_collection, get_user_by_email
-
-    # Check if email exists
-    existing = get_user_by_email(request.email)
-    if existing:
-        raise HTTPException(400, "Email already registered")
+    from database import users_collection
 
-    # Hash password and create user
-    hashed_password = pwd_context.hash(request.password)
+    # Hash password and create user; bcrypt is deliberately slow, keep it off the loop
+    hashed_password = await asyncio.to_thread(pwd_context.hash, request.password)
 
     user_doc = {
         "email": request.email,
@@ -588,7 +1008,12 @@ async def register_step1(request: RegisterRequest):
         "total_duration_min": 0
     }
 
-    result = users_collection().insert_one(user_doc)
+    # The unique email index rejects a taken address in the same round-trip
+    try:
+        result = await asyncio.to_thread(users_collection().insert_one, user_doc)
+    except DuplicateKeyError:
+        raise HTTPException(400, "Email already registered")
+    remember_created_user(request.email, str(result.inserted_id))
     return {"user_id": str(result.inserted_id), "message": "Step 1 complete"}
 
 
@@ -598,7 +1023,8 @@ async def register_step2(request: RegisterStep2Request):
     from database import users_collection
     from bson import ObjectId
 
-    result = users_collection().update_one(
+    result = await asyncio.to_thread(
+        users_collection().update_one,
         {"_id": ObjectId(request.user_id)},
         {"$set": {
             "name": request.name,
@@ -622,11 +1048,12 @@ async def login(request: LoginRequest):
     """Login with email/password."""
     from database import users_collection
 
-    user = users_collection().find_one({"email": request.email})
+    user = await asyncio.to_thread(users_collection().find_one, {"email": request.email})
     if not user:
         raise HTTPException(401, "Invalid credentials")
 
-    if not pwd_context.verify(request.password, user.get("password_hash", "")):
+    # bcrypt verify is as slow as hashing, so it runs off the loop too
+    if not await asyncio.to_thread(pwd_context.verify, request.password, user.get("password_hash", "")):
         raise HTTPException(401, "Invalid credentials")
 
     user["_id"] = str(user["_id"])
@@ -639,191 +1066,122 @@ async def login(request: LoginRequest):
 # Public Stats & Comparison Endpoints
 # ============================================================
 
+# Same answer for every user, so one aggregation serves all callers for a while;
+# process_workout_background expires it when a new workout completes
+PUBLIC_STATS_TTL_SEC = 300
+# data is the stats dict compare_to_public reads; body is the same stats
+# pre-encoded once per recompute for the public endpoint
+_public_stats_cache: dict = {"computed_at": float("-inf"), "data": None, "body": b"", "generation": 0}
+_public_stats_lock = asyncio.Lock()
+
+
+def invalidate_public_stats():
+    """Force the next cached_public_stats call to recompute."""
+    _public_stats_cache["computed_at"] = float("-inf")
+    _public_stats_cache["generation"] += 1
+
+
+async def cached_public_stats() -> dict:
+    """Shared public stats, recomputed at most every PUBLIC_STATS_TTL_SEC."""
+    if time.monotonic() - _public_stats_cache["computed_at"] < PUBLIC_STATS_TTL_SEC:
+        return _public_stats_cache["data"]
+
+    # Concurrent misses wait for the one aggregation already in flight
+    async with _public_stats_lock:
+        if time.monotonic() - _public_stats_cache["computed_at"] >= PUBLIC_STATS_TTL_SEC:
+            generation = _public_stats_cache["generation"]
+            started = time.monotonic()
+            data = await asyncio.to_thread(_compute_public_stats)
+            # An invalidation during the aggregation leaves the result marked stale
+            if generation == _public_stats_cache["generation"]:
+                _public_stats_cache["computed_at"] = started
+            _public_stats_cache["data"] = data
+            _public_stats_cache["body"] = json.dumps(data).encode()
+        return _public_stats_cache["data"]
+
+
 @app.get("/api/stats/public")
 async def get_public_stats():
-    """Get aggregated public statistics for comparison."""
-    from database import workouts_collection, users_collection
-
-    # Total counts
-    total_users = users_collection().count_documents({"registration_complete": True})
-    total_workouts = workouts_collection().count_documents({"status": "complete"})
-
-    # Aggregate muscle activation across all users
-    pipeline = [
-        {"$match": {"status": "complete", "muscle_activation.muscles": {"$exists": True}}},
-        {"$group": {
-            "_id": None,
-            "avg_form_score": {"$avg": "$form_score"},
-            "all_activations": {"$push": "$muscle_activation.muscles"},
-            "all_exercises": {"$push": "$exercises"}
-        }}
-    ]
+    """Get aggregated public statistics for comparison (cached for PUBLIC_STATS_TTL_SEC)."""
+    await cached_public_stats()
+    return Response(_public_stats_cache["body"], media_type="application/json")
+
 
-    result = list(workouts_collection().aggregate(pipeline))
+# Response keys for the public percentiles, e.g. "p25"
+PERCENTILE_KEYS = tuple(f"p{point}" for point in PUBLIC_PERCENTILE_POINTS)
 
-    if not result:
+
+def _compute_public_stats() -> dict:
+    """Aggregate public statistics across all users."""
+    bundle = get_public_stats_bundle()
+
+    if not bundle["workouts_with_activation"]:
         return {
-            "total_users": total_users,
-            "total_workouts": total_workouts,
+            "total_users": bundle["total_users"],
+            "total_workouts": bundle["total_workouts"],
             "avg_form_score": 0,
             "avg_muscle_activation": {},
             "avg_depth_metrics": {},
             "percentiles": {}
         }
 
-    data = result[0]
-
-    # Calculate average muscle activation
-    muscle_totals = {}
-    muscle_counts = {}
-    for activation in data.get("all_activations", []):
-        if isinstance(activation, dict):
-            for muscle, value in activation.items():
-                muscle_totals[muscle] = muscle_totals.get(muscle, 0) + value
-                muscle_counts[muscle] = muscle_counts.get(muscle, 0) + 1
-
-    avg_muscle = {m: muscle_totals[m] / muscle_counts[m]
-                  for m in muscle_totals if muscle_counts[m] > 0}
-
-    # Calculate depth metrics from exercises
-    knee_depths = []
-    hip_depths = []
-    for exercises in data.get("all_exercises", []):
-        for ex in (exercises or []):
-            rom = ex.get("range_of_motion", {}) or {}
-            if rom.get("knee_depth"):
-                knee_depths.append(rom["knee_depth"])
-            if rom.get("hip_depth"):
-                hip_depths.append(rom["hip_depth"])
-
-    import numpy as np
     avg_depth = {}
     percentiles = {}
-
-    if knee_depths:
-        avg_depth["knee_depth"] = float(np.mean(knee_depths))
-        percentiles["knee_depth"] = {
-            "p25": float(np.percentile(knee_depths, 25)),
-            "p50": float(np.percentile(knee_depths, 50)),
-            "p75": float(np.percentile(knee_depths, 75)),
-            "p90": float(np.percentile(knee_depths, 90))
-        }
-
-    if hip_depths:
-        avg_depth["hip_depth"] = float(np.mean(hip_depths))
-        percentiles["hip_depth"] = {
-            "p25": float(np.percentile(hip_depths, 25)),
-            "p50": float(np.percentile(hip_depths, 50)),
-            "p75": float(np.percentile(hip_depths, 75)),
-            "p90": float(np.percentile(hip_depths, 90))
-        }
-
-    # Form score percentiles
-    form_scores = list(workouts_collection().find(
-        {"status": "complete", "form_score": {"$ne": None}},
-        {"form_score": 1}
-    ))
-    if form_scores:
-        scores = [w["form_score"] for w in form_scores]
-        percentiles["form_score"] = {
-            "p25": float(np.percentile(scores, 25)),
-            "p50": float(np.percentile(scores, 50)),
-            "p75": float(np.percentile(scores, 75)),
-            "p90": float(np.percentile(scores, 90))
-        }
+    for metric, avg_key, p_key in (
+        ("knee_depth", "avg_knee_depth", "knee_percentiles"),
+        ("hip_depth", "avg_hip_depth", "hip_percentiles"),
+        ("form_score", None, "form_percentiles"),
+    ):
+        if avg_key and bundle[avg_key] is not None:
+            avg_depth[metric] = bundle[avg_key]
+        if bundle[p_key]:
+            percentiles[metric] = dict(zip(PERCENTILE_KEYS, map(float, bundle[p_key])))
 
     return {
-        "total_users": total_users,
-        "total_workouts": total_workouts,
-        "avg_form_score": data.get("avg_form_score", 0) or 0,
-        "avg_muscle_activation": avg_muscle,
+        "total_users": bundle["total_users"],
+        "total_workouts": bundle["total_workouts"],
+        "avg_form_score": bundle["avg_form_score"] or 0,
+        "avg_muscle_activation": bundle["avg_muscle_activation"],
         "avg_depth_metrics": avg_depth,
         "percentiles": percentiles
     }
 
 
+# Rank reported for a value at or above each public percentile, lowest first
+PERCENTILE_BUCKETS = (10, 25, 50, 75, 90)
+
+
+def percentile_bucket(value: float, p: Mapping[str, float]) -> int:
+    """Highest public percentile (p25/p50/p75/p90) the value reaches, else 10."""
+    cutoffs = (p["p25"], p["p50"], p["p75"], p["p90"])
+    return PERCENTILE_BUCKETS[bisect_right(cutoffs, value)]
+
+
 @app.get("/api/stats/compare/{user_id}")
 async def compare_to_public(user_id: str, days: int = 30):
     """Compare user's stats to public averages."""
-    from database import get_recent_workouts, get_muscle_activation_history, get_avg_form_score
-    import numpy as np
-
     # Resolve 'undefined' to demo user
-    if user_id == "undefined":
-        demo_user = get_user_by_email("undefined@demo.gymintel.com")
-        if demo_user:
-            user_id = demo_user.id
-
-    # Get user's stats
-    user_workouts = get_recent_workouts(user_id, days)
-    user_activation_history = get_muscle_activation_history(user_id, days)
-    user_form_score = get_avg_form_score(user_id, days)
-
-    # Aggregate user's muscle activation
-    user_muscle = {}
-    if user_activation_history:
-        for session in user_activation_history:
-            for muscle, value in session.items():
-                user_muscle[muscle] = user_muscle.get(muscle, 0) + value
-        total_sessions = len(user_activation_history)
-        user_muscle = {m: v / total_sessions for m, v in user_muscle.items()}
-
-    # Get user's depth metrics
-    user_knee_depths = []
-    user_hip_depths = []
-    for w in user_workouts:
-        for ex in w.exercises:
-            rom = ex.range_of_motion or {}
-            if rom.get("knee_depth"):
-                user_knee_depths.append(rom["knee_depth"])
-            if rom.get("hip_depth"):
-                user_hip_depths.append(rom["hip_depth"])
-
-    user_avg_knee = float(np.mean(user_knee_depths)) if user_knee_depths else 0
-    user_avg_hip = float(np.mean(user_hip_depths)) if user_hip_depths else 0
+    user_id = resolve_user_id(user_id)
+
+    # Count, form score, mean activation and depths in one aggregation
+    user_stats = await asyncio.to_thread(get_user_window_stats, user_id, days)
+    user_form_score = user_stats["avg_form_score"]
+    user_avg_knee = user_stats["avg_knee_depth"]
 
     # Get public stats
-    public_stats = await get_public_stats()
+    public_stats = await cached_public_stats()
 
     # Calculate percentile ranks
-    percentile_rank = {}
-
-    # Form score percentile
-    if user_form_score and public_stats.get("percentiles", {}).get("form_score"):
-        p = public_stats["percentiles"]["form_score"]
-        if user_form_score >= p["p90"]:
-            percentile_rank["form_score"] = 90
-        elif user_form_score >= p["p75"]:
-            percentile_rank["form_score"] = 75
-        elif user_form_score >= p["p50"]:
-            percentile_rank["form_score"] = 50
-        elif user_form_score >= p["p25"]:
-            percentile_rank["form_score"] = 25
-        else:
-            percentile_rank["form_score"] = 10
-
-    # Knee depth percentile
-    if user_avg_knee and public_stats.get("percentiles", {}).get("knee_depth"):
-        p = public_stats["percentiles"]["knee_depth"]
-        if user_avg_knee >= p["p90"]:
-            percentile_rank["knee_depth"] = 90
-        elif user_avg_knee >= p["p75"]:
-            percentile_rank["knee_depth"] = 75
-        elif user_avg_knee >= p["p50"]:
-            percentile_rank["knee_depth"] = 50
-        elif user_avg_knee >= p["p25"]:
-            percentile_rank["knee_depth"] = 25
-        else:
-            percentile_rank["knee_depth"] = 10
+    public_percentiles = public_stats.get("percentiles", {})
+    user_values = {"form_score": user_form_score, "knee_depth": user_avg_knee}
+    percentile_rank = {
+        metric: percentile_bucket(value, public_percentiles[metric])
+        for metric, value in user_values.items()
+        if value and public_percentiles.get(metric)
+    }
 
     return {
-        "user_stats": {
-            "workout_count": len(user_workouts),
-            "avg_form_score": user_form_score,
-            "muscle_activation": user_muscle,
-            "avg_knee_depth": user_avg_knee,
-            "avg_hip_depth": user_avg_hip
-        },
+        "user_stats": user_stats,
         "public_stats": public_stats,
         "percentile_rank": percentile_rank
     }
@@ -833,29 +1191,37 @@ async def compare_to_public(user_id: str, days: int = 30):
 # AI Coach Endpoints
 # ============================================================
 
-# Store active coach sessions (in production, use Redis)
-_coach_sessions: dict[str, CoachService] = {}
+# Active coach sessions; idle sessions (and their chat history) are dropped after an hour.
+# With Redis configured the history also lives there, so any worker can pick it up.
+_coach_sessions = ExpiringLRU(maxsize=settings.COACH_SESSION_CACHE_SIZE, ttl_sec=3600)
+coach_history_store = RedisCoachHistory(settings.REDIS_URL) if settings.REDIS_URL else None
+
+
+def _coach_session(user_id: str) -> CoachService:
+    """Local coach for a user, hydrated from the shared history store on a miss."""
+    coach = _coach_sessions.get(user_id)
+    if coach is None:
+        coach = CoachService(user_id, history_store=coach_history_store)
+        # Built outside the cache lock; if a concurrent first request stored one
+        # meanwhile, use theirs so the user's turns share one CoachService lock
+        coach = _coach_sessions.setdefault(user_id, coach)
+    return coach
 
 
 @app.post("/api/coach/{user_id}/chat", response_model=ChatResponse)
 async def coach_chat(user_id: str, request: ChatRequest):
     """Send a message to the AI coach and get a response."""
     # Resolve 'undefined' to demo user
-    if user_id == "undefined":
-        demo_user = get_user_by_email("undefined@demo.gymintel.com")
-        if demo_user:
-            user_id = demo_user.id
-            print(f"[API] Resolved 'undefined' coach chat request to user {user_id}")
+    user_id = resolve_user_id(user_id)
 
     # Get or create coach session
-    if user_id not in _coach_sessions:
-        _coach_sessions[user_id] = CoachService(user_id)
-
-    coach = _coach_sessions[user_id]
+    coach = await asyncio.to_thread(_coach_session, user_id)
 
     try:
-        response = coach.chat(request.message)
-        return ChatResponse(response=response, user_id=user_id)
+        # Gemini round-trips (and tool calls) block; CoachService.chat serializes
+        # turns per user with its own lock, so concurrent requests can't interleave history
+        response = await asyncio.to_thread(coach.chat, request.message)
+        return model_response(ChatResponse.model_construct(response=response, user_id=user_id))
     except Exception as e:
         print(f"[API] Coach error: {e}")
         raise HTTPException(500, f"Coach error: {str(e)}")
@@ -864,19 +1230,27 @@ async def coach_chat(user_id: str, request: ChatRequest):
 @app.post("/api/coach/{user_id}/reset")
 async def reset_coach_session(user_id: str):
     """Reset the coach conversation history."""
-    if user_id in _coach_sessions:
-        _coach_sessions[user_id].reset_conversation()
+    coach = _coach_sessions.get(user_id)
+    if coach is not None:
+        await asyncio.to_thread(coach.reset_conversation)
+    elif coach_history_store:
+        await asyncio.to_thread(coach_history_store.delete, user_id)
     return {"message": "Conversation reset", "user_id": user_id}
 
 
 @app.get("/api/coach/{user_id}/history")
 async def get_coach_history(user_id: str):
     """Get the current conversation history."""
-    if user_id not in _coach_sessions:
-        return {"history": [], "user_id": user_id}
+    if coach_history_store:
+        # Shared history is authoritative; no need to build a coach just to read it
+        contents = await asyncio.to_thread(coach_history_store.load, user_id)
+        history = simple_history(contents or [])
+    else:
+        coach = _coach_sessions.get(user_id)
+        history = coach.get_history() if coach is not None else []
 
     return {
-        "history": _coach_sessions[user_id].get_history(),
+        "history": history,
         "user_id": user_id
     }
 
@@ -885,24 +1259,36 @@ async def get_coach_history(user_id: str):
 # Health Check
 # ============================================================
 
+# Static, so encoded once at import
+_ROOT_BODY = json.dumps({
+    "name": "GymIntel API",
+    "version": API_VERSION,
+    "docs": "/docs"
+}).encode()
+
+# (unix second, body): the timestamp only has to be fresh to the second, so
+# load balancer probes within the same second reuse the encoded body
+_health_body: tuple[int, bytes] = (0, b"")
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
-    return {
-        "status": "healthy",
-        "timestamp": datetime.utcnow().isoformat(),
-        "version": "1.0.0"
-    }
+    global _health_body
+    now = int(time.time())
+    if _health_body[0] != now:
+        _health_body = (now, json.dumps({
+            "status": "healthy",
+            "timestamp": datetime.fromtimestamp(now, timezone.utc).isoformat(),
+            "version": API_VERSION
+        }).encode())
+    return Response(_health_body[1], media_type="application/json")
 
 
 @app.get("/")
 async def root():
     """Root endpoint."""
-    return {
-        "name": "GymIntel API",
-        "version": "1.0.0",
-        "docs": "/docs"
-    }
+    return Response(_ROOT_BODY, media_type="application/json")
 
 
 # ============================================================
@@ -3,6 +3,8 @@ GymIntel Muscle Mapping Module
 Maps exercises to muscle groups with activation percentages.
 Pure logic - no external dependencies.
 """
+from functools import lru_cache
+from operator import itemgetter
 from typing import TypedDict
 from dataclasses import dataclass
 
@@ -26,6 +28,15 @@ PULL_MUSCLES = {"lats", "traps", "rhomboids", "biceps", "forearms"}
 LEG_MUSCLES = {"quadriceps", "hamstrings", "glutes", "calves", "hip_flexors"}
 CORE_MUSCLES = {"core", "obliques", "lower_back"}
 
+# Internally activations are fixed-length lists indexed by MUSCLE_INDEX;
+# dicts keyed by muscle name are only built at the module boundary.
+MUSCLE_INDEX = {muscle: i for i, muscle in enumerate(MUSCLE_GROUPS)}
+NUM_MUSCLES = len(MUSCLE_GROUPS)
+PUSH_INDICES = tuple(MUSCLE_INDEX[m] for m in PUSH_MUSCLES)
+PULL_INDICES = tuple(MUSCLE_INDEX[m] for m in PULL_MUSCLES)
+LEG_INDICES = tuple(MUSCLE_INDEX[m] for m in LEG_MUSCLES)
+CORE_INDICES = tuple(MUSCLE_INDEX[m] for m in CORE_MUSCLES)
+
 # ============================================================
 # Exercise -> Muscle Activation Database
 # Primary muscles: 0.3-0.5 activation per exercise
@@ -198,28 +209,50 @@ EXERCISE_MUSCLE_MAP: dict[str, MuscleActivation] = {
     },
 }
 
+# (muscle index, activation) pairs per exercise, primary before secondary
+EXERCISE_CONTRIBUTIONS: dict[str, tuple[tuple[int, float], ...]] = {
+    name: tuple(
+        (MUSCLE_INDEX[muscle], value)
+        for part in (data["primary"], data["secondary"])
+        for muscle, value in part.items()
+        if muscle in MUSCLE_INDEX
+    )
+    for name, data in EXERCISE_MUSCLE_MAP.items()
+}
+
 
 def normalize_exercise_name(name: str) -> str:
     """Normalize exercise name for lookup."""
     return name.lower().strip()
 
 
-def get_muscle_activation(exercise: str) -> MuscleActivation | None:
-    """Get muscle activation for an exercise."""
+@lru_cache(maxsize=4096)
+def match_exercise(exercise: str) -> str | None:
+    """
+    Resolve an exercise name to its EXERCISE_MUSCLE_MAP key.
+    Memoized: the same few names recur across sessions, so the fuzzy scan
+    runs once per distinct spelling.
+    """
     normalized = normalize_exercise_name(exercise)
 
     # Direct match
     if normalized in EXERCISE_MUSCLE_MAP:
-        return EXERCISE_MUSCLE_MAP[normalized]
+        return normalized
 
     # Fuzzy match - check if any key is contained in the exercise name
     for key in EXERCISE_MUSCLE_MAP:
         if key in normalized or normalized in key:
-            return EXERCISE_MUSCLE_MAP[key]
+            return key
 
     return None
 
 
+def get_muscle_activation(exercise: str) -> MuscleActivation | None:
+    """Get muscle activation for an exercise."""
+    key = match_exercise(exercise)
+    return EXERCISE_MUSCLE_MAP[key] if key is not None else None
+
+
 def calculate_session_activation(
         exercises: list[dict],  # [{"name": str, "duration_sec": float, "reps": int, "avg_quality_score": float, "weight_kg": float}]
 ) -> dict[str, float]:
@@ -228,12 +261,12 @@ def calculate_session_activation(
     Weights by duration and reps to estimate time-under-tension.
     Returns normalized activation scores (0.0 - 1.0).
     """
-    activation = {muscle: 0.0 for muscle in MUSCLE_GROUPS}
+    activation = [0.0] * NUM_MUSCLES
     total_weight = 0.0
 
     for ex in exercises:
-        muscle_data = get_muscle_activation(ex["name"])
-        if not muscle_data:
+        key = match_exercise(ex["name"])
+        if key is None:
             continue
             
         # Extract intensity modifiers
@@ -260,23 +293,39 @@ def calculate_session_activation(
         
         total_weight += work_unit
 
-        # Add primary muscle activations
-        for muscle, value in muscle_data["primary"].items():
-            if muscle in activation:
-                activation[muscle] += value * work_unit
-
-        # Add secondary muscle activations
-        for muscle, value in muscle_data["secondary"].items():
-            if muscle in activation:
-                activation[muscle] += value * work_unit
+        # Add primary and secondary muscle activations
+        for idx, value in EXERCISE_CONTRIBUTIONS[key]:
+            activation[idx] += value * work_unit
 
     # Normalize to 0-1 range
     if total_weight > 0:
-        max_activation = max(activation.values()) if activation.values() else 1
+        max_activation = max(activation)
         if max_activation > 0:
-            activation = {k: min(v / max_activation, 1.0) for k, v in activation.items()}
+            activation = [min(v / max_activation, 1.0) for v in activation]
+
+    return dict(zip(MUSCLE_GROUPS, activation))
+
 
-    return activation
+PRIMARY_THRESHOLD = 0.3
+SECONDARY_THRESHOLD = 0.1
+
+
+def split_primary_secondary(activation: dict[str, float], limit: int = 3) -> tuple[list[str], list[str]]:
+    """
+    Pick the top primary (> 0.3) and secondary (0.1 - 0.3) muscles from a
+    session activation in one sorted pass.
+    """
+    primary, secondary = [], []
+    for muscle, value in sorted(activation.items(), key=itemgetter(1), reverse=True):
+        if value > PRIMARY_THRESHOLD:
+            if len(primary) < limit:
+                primary.append(muscle)
+        elif value > SECONDARY_THRESHOLD and len(secondary) < limit:
+            secondary.append(muscle)
+        else:
+            # Values only decrease from here
+            break
+    return primary, secondary
 
 
 def analyze_muscle_balance(
@@ -290,21 +339,22 @@ def analyze_muscle_balance(
         return {"status": "no_data", "insights": []}
 
     # Aggregate activations
-    total = {muscle: 0.0 for muscle in MUSCLE_GROUPS}
+    total = [0.0] * NUM_MUSCLES
     for session in activation_history:
         for muscle, value in session.items():
-            if muscle in total:
-                total[muscle] += value
+            idx = MUSCLE_INDEX.get(muscle)
+            if idx is not None:
+                total[idx] += value
 
     # Normalize
-    max_val = max(total.values()) if total.values() else 1
-    normalized = {k: v / max_val if max_val > 0 else 0 for k, v in total.items()}
+    max_val = max(total)
+    normalized = [v / max_val if max_val > 0 else 0 for v in total]
 
     # Calculate category balances
-    push_total = sum(normalized.get(m, 0) for m in PUSH_MUSCLES) / len(PUSH_MUSCLES)
-    pull_total = sum(normalized.get(m, 0) for m in PULL_MUSCLES) / len(PULL_MUSCLES)
-    leg_total = sum(normalized.get(m, 0) for m in LEG_MUSCLES) / len(LEG_MUSCLES)
-    core_total = sum(normalized.get(m, 0) for m in CORE_MUSCLES) / len(CORE_MUSCLES)
+    push_total = sum(normalized[i] for i in PUSH_INDICES) / len(PUSH_INDICES)
+    pull_total = sum(normalized[i] for i in PULL_INDICES) / len(PULL_INDICES)
+    leg_total = sum(normalized[i] for i in LEG_INDICES) / len(LEG_INDICES)
+    core_total = sum(normalized[i] for i in CORE_INDICES) / len(CORE_INDICES)
 
     insights = []
 
@@ -327,7 +377,7 @@ def analyze_muscle_balance(
             })
 
     # Identify undertrained muscles
-    undertrained = [m for m, v in normalized.items() if v < 0.3 and max_val > 0]
+    undertrained = [m for m, v in zip(MUSCLE_GROUPS, normalized) if v < 0.3 and max_val > 0]
     if undertrained:
         insights.append({
             "type": "undertrained",
@@ -339,7 +389,7 @@ def analyze_muscle_balance(
 
     return {
         "status": "analyzed",
-        "muscle_totals": normalized,
+        "muscle_totals": dict(zip(MUSCLE_GROUPS, normalized)),
         "category_balance": {
             "push": push_total,
             "pull": pull_total,
@@ -6,13 +6,199 @@ import cv2
 import mediapipe as mp
 import numpy as np
 import math
-from typing import Dict, List, Optional, Tuple, Any
+import queue
+import threading
+from typing import Dict, Iterator, List, Optional, Any
 from dataclasses import dataclass
 
+from config import settings
+
 # Initialize MediaPipe Pose
 mp_pose = mp.solutions.pose
 mp_drawing = mp.solutions.drawing_utils
 
+
+def _create_landmarker(model_path: str, use_gpu: bool):
+    """
+    Tasks-API PoseLandmarker in VIDEO mode, on the GPU delegate when requested.
+    Returns None when it can't be created (no GPU/driver, bad model path) so the
+    caller falls back to the CPU Pose solution.
+    """
+    vision = mp.tasks.vision
+    delegates = [mp.tasks.BaseOptions.Delegate.GPU] if use_gpu else []
+    delegates.append(mp.tasks.BaseOptions.Delegate.CPU)
+    for delegate in delegates:
+        try:
+            options = vision.PoseLandmarkerOptions(
+                base_options=mp.tasks.BaseOptions(model_asset_path=model_path, delegate=delegate),
+                running_mode=vision.RunningMode.VIDEO,
+                num_poses=1,
+                min_pose_detection_confidence=0.5,
+                min_tracking_confidence=0.5
+            )
+            landmarker = vision.PoseLandmarker.create_from_options(options)
+            print(f"[Pose] PoseLandmarker running on {delegate.name}")
+            return landmarker
+        except Exception as e:
+            print(f"[Pose] PoseLandmarker unavailable on {delegate.name}: {e}")
+    return None
+
+
+# Optional: PyAV decodes with FFmpeg's frame threading and yields RGB directly
+try:
+    import av
+except ImportError:
+    av = None
+
+
+def _segment_frames_av(video_path: str, start_sec: float, end_sec: float, frame_skip: int):
+    """(fps, iterator of (frame_idx, rgb)) for every frame_skip-th frame of the segment, via PyAV."""
+    container = av.open(video_path)
+    stream = container.streams.video[0]
+    stream.thread_type = "AUTO"
+    fps = float(stream.average_rate or 0)
+
+    def frames():
+        try:
+            if start_sec > 0 and stream.time_base:
+                # Lands on the keyframe before start_sec; earlier frames are decoded and dropped
+                container.seek(int(start_sec / stream.time_base), stream=stream)
+            n = 0
+            for frame in container.decode(stream):
+                t = frame.time
+                if t is not None and t < start_sec:
+                    continue
+                if t is not None and t > end_sec:
+                    break
+                if n % frame_skip == 0:
+                    idx = int(round(t * fps)) if t is not None else int(start_sec * fps) + n
+                    yield idx, frame.to_ndarray(format="rgb24")
+                n += 1
+        finally:
+            container.close()
+
+    return fps, frames()
+
+
+def _segment_frames_cv2(video_path: str, start_sec: float, end_sec: float, frame_skip: int):
+    """(fps, iterator of (frame_idx, rgb)) for every frame_skip-th frame of the segment, via OpenCV."""
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+
+    def frames():
+        try:
+            current_frame = int(start_sec * fps)
+            end_frame = int(end_sec * fps)
+            cap.set(cv2.CAP_PROP_POS_FRAMES, current_frame)
+            while cap.isOpened() and current_frame <= end_frame:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                # MediaPipe expects RGB
+                yield current_frame, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+                current_frame += 1
+                # Skip frames using grab() which is faster than read() or set()
+                for _ in range(frame_skip - 1):
+                    if not cap.grab():
+                        break
+                    current_frame += 1
+        finally:
+            cap.release()
+
+    return fps, frames()
+
+
+# Decoded frames buffered ahead of inference; bounds memory at this many RGB frames per segment
+FRAME_PREFETCH = 4
+
+
+def prefetch(items: Iterator, maxsize: int = FRAME_PREFETCH) -> Iterator:
+    """
+    Drive `items` on a background thread, handing results over through a bounded
+    queue, so decoding the next frames overlaps inference on the current one
+    (MediaPipe and FFmpeg both release the GIL). Producer errors are re-raised here;
+    stopping early stops the producer and closes `items`.
+    """
+    handoff = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(entry) -> bool:
+        while not stop.is_set():
+            try:
+                handoff.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(("item", item)):
+                    return
+            put(("done", None))
+        except Exception as e:
+            put(("error", e))
+        finally:
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+
+    producer = threading.Thread(target=produce, name="pose-decode", daemon=True)
+    producer.start()
+    try:
+        while True:
+            kind, payload = handoff.get()
+            if kind == "item":
+                yield payload
+            elif kind == "error":
+                raise payload
+            else:
+                return
+    finally:
+        stop.set()
+        producer.join()
+
+
+def open_segment_frames(video_path: str, start_sec: float, end_sec: float, frame_skip: int):
+    """Decode a segment with PyAV when installed, falling back to OpenCV."""
+    if av is not None:
+        try:
+            return _segment_frames_av(video_path, start_sec, end_sec, frame_skip)
+        except Exception as e:
+            print(f"[Pose] PyAV could not open {video_path}, using OpenCV: {e}")
+    return _segment_frames_cv2(video_path, start_sec, end_sec, frame_skip)
+
+
+_L = mp_pose.PoseLandmark
+
+# (a, b, c) landmark indices per tracked joint; the angle is measured at b
+JOINT_TRIPLETS = {
+    "left_elbow": (_L.LEFT_SHOULDER, _L.LEFT_ELBOW, _L.LEFT_WRIST),  # Shoulder -> Elbow -> Wrist
+    "right_elbow": (_L.RIGHT_SHOULDER, _L.RIGHT_ELBOW, _L.RIGHT_WRIST),
+    "left_shoulder": (_L.LEFT_HIP, _L.LEFT_SHOULDER, _L.LEFT_ELBOW),  # Hip -> Shoulder -> Elbow
+    "right_shoulder": (_L.RIGHT_HIP, _L.RIGHT_SHOULDER, _L.RIGHT_ELBOW),
+    "left_hip": (_L.LEFT_SHOULDER, _L.LEFT_HIP, _L.LEFT_KNEE),  # Shoulder -> Hip -> Knee
+    "right_hip": (_L.RIGHT_SHOULDER, _L.RIGHT_HIP, _L.RIGHT_KNEE),
+    "left_knee": (_L.LEFT_HIP, _L.LEFT_KNEE, _L.LEFT_ANKLE),  # Hip -> Knee -> Ankle
+    "right_knee": (_L.RIGHT_HIP, _L.RIGHT_KNEE, _L.RIGHT_ANKLE),
+}
+JOINT_NAMES = tuple(JOINT_TRIPLETS)
+_TRIPLET_INDEX = np.array([[int(i) for i in t] for t in JOINT_TRIPLETS.values()])
+# A joint's angle is only recorded when all three of its landmarks are at least this visible
+VISIBILITY_THRESHOLD = 0.5
+
+
+def joint_angles(points: np.ndarray) -> np.ndarray:
+    """Angles (degrees, 0-180) for every JOINT_TRIPLETS joint from (33, 2) landmark x/y."""
+    tri = points[_TRIPLET_INDEX]  # (joints, 3, 2)
+    ba = tri[:, 0] - tri[:, 1]
+    bc = tri[:, 2] - tri[:, 1]
+    angle = np.abs(np.degrees(np.arctan2(bc[:, 1], bc[:, 0]) - np.arctan2(ba[:, 1], ba[:, 0])))
+    return np.where(angle > 180.0, 360.0 - angle, angle)
+
+
 @dataclass
 class PoseMetrics:
     joint_angles: Dict[str, List[float]]  # time-series of angles
@@ -24,176 +210,120 @@ class PoseMetrics:
     avg_quality_score: float = 1.0 # 0.5 to 1.5 multiplier based on ROM/Control
 
 class PoseAnalyzer:
-    def __init__(self):
-        self.pose = mp_pose.Pose(
-            static_image_mode=False,
-            model_complexity=1,
-            smooth_landmarks=True,
-            enable_segmentation=False,
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
+    def __init__(self, use_gpu: Optional[bool] = None):
+        use_gpu = settings.POSE_USE_GPU if use_gpu is None else use_gpu
+        self.landmarker = (
+            _create_landmarker(settings.POSE_LANDMARKER_MODEL, use_gpu)
+            if settings.POSE_LANDMARKER_MODEL else None
         )
+        # VIDEO mode needs strictly increasing timestamps for the landmarker's lifetime
+        self._timestamp_ms = 0
 
-    def calculate_angle(self, a, b, c) -> float:
-        """Calculate angle between three points (a->b->c)."""
-        a = np.array(a)  # First
-        b = np.array(b)  # Mid
-        c = np.array(c)  # End
+        self.pose = None
+        if self.landmarker is None:
+            self.pose = mp_pose.Pose(
+                static_image_mode=False,
+                model_complexity=1,
+                smooth_landmarks=True,
+                enable_segmentation=False,
+                min_detection_confidence=0.5,
+                min_tracking_confidence=0.5
+            )
 
-        radians = np.arctan2(c[1] - b[1], c[0] - b[0]) - np.arctan2(a[1] - b[1], a[0] - b[0])
-        angle = np.abs(radians * 180.0 / np.pi)
+    def detect(self, image: np.ndarray, frame_ms: float):
+        """Pose landmarks for one RGB frame (33 with .x/.y/.visibility), or None."""
+        if self.landmarker is not None:
+            self._timestamp_ms += max(1, int(frame_ms))
+            result = self.landmarker.detect_for_video(
+                mp.Image(image_format=mp.ImageFormat.SRGB, data=image), self._timestamp_ms
+            )
+            return result.pose_landmarks[0] if result.pose_landmarks else None
 
-        if angle > 180.0:
-            angle = 360 - angle
+        results = self.pose.process(image)
+        return results.pose_landmarks.landmark if results.pose_landmarks else None
 
-        return angle
+    def reset(self):
+        """Drop landmark tracking carried over from a previous segment."""
+        # The Tasks landmarker has no reset; it re-detects once tracking confidence drops
+        if self.pose is not None:
+            self.pose.reset()
 
-    def get_landmarks_dict(self, results) -> Dict[str, Tuple[float, float]]:
-        """Extract relevant landmarks as {name: (x, y)}"""
-        if not results.pose_landmarks:
-            return {}
-        
-        landmarks = results.pose_landmarks.landmark
-        mapping = {
-            "nose": mp_pose.PoseLandmark.NOSE,
-            "left_shoulder": mp_pose.PoseLandmark.LEFT_SHOULDER,
-            "right_shoulder": mp_pose.PoseLandmark.RIGHT_SHOULDER,
-            "left_elbow": mp_pose.PoseLandmark.LEFT_ELBOW,
-            "right_elbow": mp_pose.PoseLandmark.RIGHT_ELBOW,
-            "left_wrist": mp_pose.PoseLandmark.LEFT_WRIST,
-            "right_wrist": mp_pose.PoseLandmark.RIGHT_WRIST,
-            "left_hip": mp_pose.PoseLandmark.LEFT_HIP,
-            "right_hip": mp_pose.PoseLandmark.RIGHT_HIP,
-            "left_knee": mp_pose.PoseLandmark.LEFT_KNEE,
-            "right_knee": mp_pose.PoseLandmark.RIGHT_KNEE,
-            "left_ankle": mp_pose.PoseLandmark.LEFT_ANKLE,
-            "right_ankle": mp_pose.PoseLandmark.RIGHT_ANKLE,
-        }
-        
-        return {
-            name: (landmarks[idx].x, landmarks[idx].y) 
-            for name, idx in mapping.items()
-        }
+    def warm_up(self):
+        """Run one blank frame through the model so graph and weight setup happens up front."""
+        self.detect(np.zeros((256, 256, 3), np.uint8), 1.0)
+        self.reset()
 
     def analyze_segment(self, video_path: str, start_sec: float, end_sec: float) -> Optional[PoseMetrics]:
         """
         Analyze a specific video segment for pose metrics.
         """
-        cap = cv2.VideoCapture(video_path)
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        
-        start_frame = int(start_sec * fps)
-        end_frame = int(end_sec * fps)
-        
-        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
-        
-        current_frame = start_frame
-        
-        # Trackers
-        angles_history = {
-            "left_elbow": [], "right_elbow": [],
-            "left_shoulder": [], "right_shoulder": [],
-            "left_hip": [], "right_hip": [],
-            "left_knee": [], "right_knee": []
-        }
-        
-        # Rep counting (simplified peak prediction)
-        # Using elbow or knee average as proxy for movement
-        movement_proxy = []
-        
         # Optimization: Process every 5th frame to speed up analysis
         # For strength training, movements are slow enough that ~6 FPS is sufficient
         FRAME_SKIP = 5
+
+        self.reset()
+        fps, frames = open_segment_frames(video_path, start_sec, end_sec, FRAME_SKIP)
+        start_frame = int(start_sec * fps)
+        end_frame = int(end_sec * fps)
+
+        # Trackers: one row per JOINT_NAMES joint, one column per analyzed frame,
+        # sized up front from the segment length (grown only if the estimate is short)
+        angles_arr = np.empty((len(JOINT_NAMES), max(end_frame - start_frame, 0) // FRAME_SKIP + 2))
+        n_filled = 0
+        # Spacing of analyzed frames, for the landmarker's video timestamps
+        frame_ms = 1000.0 * FRAME_SKIP / fps if fps > 0 else 1.0
         
         # Frame capture for Gemini (Capture middle frame)
         middle_frame_idx = (start_frame + end_frame) // 2
         representative_frame_bytes = None
 
-        while cap.isOpened() and current_frame <= end_frame:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
+        # Decode runs on its own thread a few frames ahead of pose detection
+        for current_frame, image in prefetch(frames):
             # Capture representative frame
             if abs(current_frame - middle_frame_idx) < FRAME_SKIP:
-                 success, encoded_img = cv2.imencode('.jpg', frame)
+                 success, encoded_img = cv2.imencode('.jpg', cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
                  if success:
                      representative_frame_bytes = encoded_img.tobytes()
                      # Don't capture again
                      middle_frame_idx = -1 
 
             # Perform Pose Detection
-            # MediaPipe expects RGB
-            image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
             image.flags.writeable = False
-            results = self.pose.process(image)
+            landmarks = self.detect(image, frame_ms)
             
-            if results.pose_landmarks:
-                lm = self.get_landmarks_dict(results)
-                
-                # Calculate key angles
-                # Elbow: Shoulder -> Elbow -> Wrist
-                if all(k in lm for k in ["left_shoulder", "left_elbow", "left_wrist"]):
-                    angle = self.calculate_angle(lm["left_shoulder"], lm["left_elbow"], lm["left_wrist"])
-                    angles_history["left_elbow"].append(angle)
-                    
-                if all(k in lm for k in ["right_shoulder", "right_elbow", "right_wrist"]):
-                    angle = self.calculate_angle(lm["right_shoulder"], lm["right_elbow"], lm["right_wrist"])
-                    angles_history["right_elbow"].append(angle)
-
-                # Shoulder: Hip -> Shoulder -> Elbow
-                if all(k in lm for k in ["left_hip", "left_shoulder", "left_elbow"]):
-                    angle = self.calculate_angle(lm["left_hip"], lm["left_shoulder"], lm["left_elbow"])
-                    angles_history["left_shoulder"].append(angle)
-                    
-                if all(k in lm for k in ["right_hip", "right_shoulder", "right_elbow"]):
-                    angle = self.calculate_angle(lm["right_hip"], lm["right_shoulder"], lm["right_elbow"])
-                    angles_history["right_shoulder"].append(angle)
-
-                # Hip: Shoulder -> Hip -> Knee
-                if all(k in lm for k in ["left_shoulder", "left_hip", "left_knee"]):
-                    angle = self.calculate_angle(lm["left_shoulder"], lm["left_hip"], lm["left_knee"])
-                    angles_history["left_hip"].append(angle)
-                    
-                if all(k in lm for k in ["right_shoulder", "right_hip", "right_knee"]):
-                    angle = self.calculate_angle(lm["right_shoulder"], lm["right_hip"], lm["right_knee"])
-                    angles_history["right_hip"].append(angle)
-                    
-                # Knee: Hip -> Knee -> Ankle
-                if all(k in lm for k in ["left_hip", "left_knee", "left_ankle"]):
-                    angle = self.calculate_angle(lm["left_hip"], lm["left_knee"], lm["left_ankle"])
-                    angles_history["left_knee"].append(angle)
-                
-                if all(k in lm for k in ["right_hip", "right_knee", "right_ankle"]):
-                    angle = self.calculate_angle(lm["right_hip"], lm["right_knee"], lm["right_ankle"])
-                    angles_history["right_knee"].append(angle)
-                    
-                # Add to movement proxy (avg of all active joints)
-                # This is a crude heuristic but robust enough for detecting "activity" cycles
-                current_angles = []
-                for k, v in angles_history.items():
-                    if v: current_angles.append(v[-1])
-                if current_angles:
-                    movement_proxy.append(sum(current_angles) / len(current_angles))
-
-            current_frame += 1
-            # Skip frames using grab() which is faster than read() or set()
-            for _ in range(FRAME_SKIP - 1):
-                if not cap.grab():
-                    break
-                current_frame += 1
+            if landmarks:
+                # (33, 3) x, y, visibility; all eight joint angles in one vectorized pass,
+                # with joints whose landmarks aren't actually tracked left as NaN
+                lms = np.array([(l.x, l.y, l.visibility) for l in landmarks], dtype=np.float32)
+                tracked = lms[_TRIPLET_INDEX, 2].min(axis=1) >= VISIBILITY_THRESHOLD
+                if tracked.any():
+                    if n_filled == angles_arr.shape[1]:
+                        angles_arr = np.concatenate([angles_arr, np.empty_like(angles_arr)], axis=1)
+                    angles_arr[:, n_filled] = np.where(tracked, joint_angles(lms[:, :2]), np.nan)
+                    n_filled += 1
 
-        cap.release()
-        
         # Analyze captured data
-        if not any(angles_history.values()):
+        if n_filled == 0:
             return None
-            
-        # Calculate Min/Max stats
-        min_angles = {k: min(v) if v else 0.0 for k, v in angles_history.items()}
-        max_angles = {k: max(v) if v else 0.0 for k, v in angles_history.items()}
-        
+        angles = angles_arr[:, :n_filled]
+        visible = ~np.isnan(angles)
+        angles_history = {name: row[ok].tolist() for name, row, ok in zip(JOINT_NAMES, angles, visible)}
+
+        # Calculate Min/Max stats (NaN-skipping); joints never visible are left out,
+        # so consumers fall back to their own defaults for them
+        seen = visible.any(axis=1)
+        min_angles = {n: v for n, v, s in zip(JOINT_NAMES, np.fmin.reduce(angles, axis=1).tolist(), seen) if s}
+        max_angles = {n: v for n, v, s in zip(JOINT_NAMES, np.fmax.reduce(angles, axis=1).tolist(), seen) if s}
+
+        # Rep counting (simplified peak prediction)
+        # Movement proxy: average of all joint angles per frame. This is a crude
+        # heuristic but robust enough for detecting "activity" cycles. Each joint
+        # carries its last visible angle forward, so joints flickering in and out of
+        # view don't make the average jump.
+        last_seen = np.maximum.accumulate(np.where(visible, np.arange(n_filled), 0), axis=1)
+        filled = np.take_along_axis(angles, last_seen, axis=1)
+        movement_proxy = np.nanmean(filled, axis=0)
+
         # Simple Rep Counting from movement proxy
         # Count peaks in the movement signal
         rep_count = self._count_reps(movement_proxy, fps / FRAME_SKIP)
@@ -225,8 +355,8 @@ class PoseAnalyzer:
             avg_quality_score=quality_score
         )
 
-    def _count_reps(self, signal: List[float], fps: float) -> int:
-        if not signal:
+    def _count_reps(self, signal: np.ndarray, fps: float) -> int:
+        if len(signal) == 0:
             return 0
         
         # Quick & dirty peak detection
@@ -240,23 +370,27 @@ class PoseAnalyzer:
             
         normalized = (sig_arr - np.min(sig_arr)) / (np.max(sig_arr) - np.min(sig_arr))
         
-        # Count crossing 0.7 threshold going up
-        reps = 0
-        in_rep = False
-        cooldown = 0
+        # Count crossing 0.7 threshold going up; a rep re-arms once the signal drops
+        # below 0.3 and min_rep_frames have passed. Jumps between threshold hits with
+        # searchsorted, so the loop runs once per rep rather than once per frame.
         min_rep_frames = int(fps * 1.5) # Assume rep takes at least 1.5s
-        
-        for i, val in enumerate(normalized):
-            if val > 0.7 and not in_rep and cooldown == 0:
-                reps += 1
-                in_rep = True
-                cooldown = min_rep_frames
-            elif val < 0.3:
-                in_rep = False
-                
-            if cooldown > 0:
-                cooldown -= 1
-                
+        highs = np.flatnonzero(normalized > 0.7)
+        lows = np.flatnonzero(normalized < 0.3)
+        if len(highs) == 0:
+            return 0
+
+        reps = 1
+        rep_at = highs[0]
+        while True:
+            reset = np.searchsorted(lows, rep_at, side="right")
+            if reset == len(lows):
+                break
+            nxt = np.searchsorted(highs, max(lows[reset] + 1, rep_at + min_rep_frames))
+            if nxt == len(highs):
+                break
+            rep_at = highs[nxt]
+            reps += 1
+
         return reps
 
     def _generate_feedback(self, mins: Dict[str, float], maxs: Dict[str, float], reps: int) -> List[str]:
@@ -285,3 +419,17 @@ class PoseAnalyzer:
             feedback.append("Detected asymmetry in arm movements.")
             
         return feedback
+
+
+# MediaPipe graphs are stateful and not thread-safe, so each worker thread keeps its own
+_thread_state = threading.local()
+
+
+def get_pose_analyzer() -> PoseAnalyzer:
+    """Get or create this thread's warmed-up PoseAnalyzer."""
+    analyzer = getattr(_thread_state, "analyzer", None)
+    if analyzer is None:
+        analyzer = PoseAnalyzer()
+        analyzer.warm_up()
+        _thread_state.analyzer = analyzer
+    return analyzer
@@ -4,6 +4,7 @@ Test video processing end-to-end with a test video.
 """
 import sys
 import time
+from operator import itemgetter
 from pathlib import Path
 
 # Add parent directory to path
@@ -11,8 +12,7 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from config import settings
 from twelvelabs_service import process_workout_video, get_or_create_index
-from muscle_map import calculate_session_activation, EXERCISE_MUSCLE_MAP
-from gemini_service import calculate_form_score
+from muscle_map import EXERCISE_MUSCLE_MAP
 from pose_service import PoseAnalyzer
 
 
@@ -87,21 +87,18 @@ def test_video_processing(video_path: str, analyze_deeply: bool = True):
                 else:
                     print(f"      Joint Angles: {ex.avg_joint_angles}")
 
-        # Calculate muscle activation
+        # Muscle activation and form score come back from the pipeline
         if exercises:
-            exercise_data = [
-                {"name": ex.name, "duration_sec": ex.duration_sec, "reps": ex.reps}
-                for ex in exercises
-            ]
-            muscle_activation = calculate_session_activation(exercise_data)
-            form_score = calculate_form_score(exercises)
+            muscle_activation = result["muscle_activation"]
+            form_score = result["form_score"]
 
             print(f"\n💪 MUSCLE ACTIVATION")
-            sorted_muscles = sorted(muscle_activation.items(), key=lambda x: -x[1])
-            for muscle, value in sorted_muscles:
-                if value > 0.05:
-                    bar = "█" * int(value * 30)
-                    print(f"      {muscle:15} {bar} {value:.0%}")
+            # Drop the near-zero muscles before sorting what's left
+            shown = [(m, v) for m, v in muscle_activation.items() if v > 0.05]
+            shown.sort(key=itemgetter(1), reverse=True)
+            for muscle, value in shown:
+                bar = "█" * int(value * 30)
+                print(f"      {muscle:15} {bar} {value:.0%}")
 
             print(f"\n📊 FORM SCORE: {form_score:.0f}%")
 
@@ -12,11 +12,11 @@ from twelvelabs.indexes import IndexesCreateRequestModelsItem
 
 from config import settings
 from models import ExerciseSegment, FormFeedback, FormSeverity, Workout, MuscleActivationSummary, WorkoutStatus
-from muscle_map import calculate_session_activation
+from muscle_map import calculate_session_activation, split_primary_secondary
 from gemini_service import calculate_form_score
-from pose_service import PoseAnalyzer
+from pose_service import get_pose_analyzer
 import concurrent.futures
-from functools import partial
+from functools import lru_cache, partial
 
 
 from gemini_service import estimate_weight_from_image
@@ -42,8 +42,13 @@ def get_client() -> TwelveLabs:
 
 def get_or_create_index(index_name: str = None) -> str:
     """Get existing index or create a new one. Returns index_id."""
+    return _find_or_create_index(index_name or settings.TWELVELABS_INDEX_NAME)
+
+
+@lru_cache(maxsize=16)
+def _find_or_create_index(index_name: str) -> str:
+    """Index lookup/creation, memoized per name; failures raise and are not cached."""
     client = get_client()
-    index_name = index_name or settings.TWELVELABS_INDEX_NAME
 
     # Check if index exists
     try:
@@ -354,10 +359,14 @@ def parse_exercise_data(data: dict) -> list[ExerciseSegment]:
 # Pose Analysis Worker
 # ============================================================
 
+# Long-lived so each thread's MediaPipe analyzer (see get_pose_analyzer) is reused across workouts
+_pose_pool = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="gymintel-pose")
+
+
 def _analyze_segment_worker(video_path: str, exercise_data: dict):
     """Worker function for parallel pose analysis."""
     try:
-        analyzer = PoseAnalyzer()
+        analyzer = get_pose_analyzer()
         metrics = analyzer.analyze_segment(
             video_path, 
             exercise_data['start_sec'], 
@@ -545,49 +554,48 @@ def process_workout_video(
     if exercises and file_path:
         update_status("Analyzing biomechanics...", 60)
         
-        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-            future_to_exercise = {
-                executor.submit(_analyze_segment_worker, file_path, {
-                    'start_sec': ex.start_sec,
-                    'end_sec': ex.end_sec
-                }): ex
-                for ex in exercises
-            }
+        future_to_exercise = {
+            _pose_pool.submit(_analyze_segment_worker, file_path, {
+                'start_sec': ex.start_sec,
+                'end_sec': ex.end_sec
+            }): ex
+            for ex in exercises
+        }
+        
+        completed_count = 0
+        for future in concurrent.futures.as_completed(future_to_exercise):
+            ex = future_to_exercise[future]
+            try:
+                metrics = future.result()
+                if metrics:
+                    ex.reps = metrics.rep_count if metrics.rep_count > 0 else ex.reps
+                    ex.avg_quality_score = metrics.avg_quality_score
+                    
+                    ex.avg_joint_angles = {
+                        "elbow_min": metrics.min_angles.get("left_elbow", 0),
+                        "elbow_max": metrics.max_angles.get("left_elbow", 0),
+                        "knee_min": metrics.min_angles.get("left_knee", 0),
+                        "knee_max": metrics.max_angles.get("left_knee", 0)
+                    }
+                    
+                    if metrics.representative_frame:
+                        weight = estimate_weight_from_image(metrics.representative_frame, ex.name)
+                        if weight > 0:
+                            ex.weight_kg = weight
+                            ex.avg_quality_score *= (1 + (weight / 100))
+                    
+                    for note in metrics.feedback:
+                        ex.form_feedback.append(FormFeedback(
+                            timestamp_sec=ex.start_sec,
+                            severity=FormSeverity.INFO,
+                            note=note
+                        ))
+            except Exception as exc:
+                print(f"Pose analysis exception for {ex.name}: {exc}")
             
-            completed_count = 0
-            for future in concurrent.futures.as_completed(future_to_exercise):
-                ex = future_to_exercise[future]
-                try:
-                    metrics = future.result()
-                    if metrics:
-                        ex.reps = metrics.rep_count if metrics.rep_count > 0 else ex.reps
-                        ex.avg_quality_score = metrics.avg_quality_score
-                        
-                        ex.avg_joint_angles = {
-                            "elbow_min": metrics.min_angles.get("left_elbow", 0),
-                            "elbow_max": metrics.max_angles.get("left_elbow", 0),
-                            "knee_min": metrics.min_angles.get("left_knee", 0),
-                            "knee_max": metrics.max_angles.get("left_knee", 0)
-                        }
-                        
-                        if metrics.representative_frame:
-                            weight = estimate_weight_from_image(metrics.representative_frame, ex.name)
-                            if weight > 0:
-                                ex.weight_kg = weight
-                                ex.avg_quality_score *= (1 + (weight / 100))
-                        
-                        for note in metrics.feedback:
-                            ex.form_feedback.append(FormFeedback(
-                                timestamp_sec=ex.start_sec,
-                                severity=FormSeverity.INFO,
-                                note=note
-                            ))
-                except Exception as exc:
-                    print(f"Pose analysis exception for {ex.name}: {exc}")
-                
-                completed_count += 1
-                progress = 60 + int((completed_count / len(exercises)) * 30)
-                update_status(f"Analyzed {ex.name}", progress)
+            completed_count += 1
+            progress = 60 + int((completed_count / len(exercises)) * 30)
+            update_status(f"Analyzed {ex.name}", progress)
 
     update_status("Saving results...", 95)
     
@@ -599,8 +607,7 @@ def process_workout_video(
     muscle_activation = calculate_session_activation(exercise_summary)
     form_score = calculate_form_score(exercises)
     
-    primary = [m for m, v in sorted(muscle_activation.items(), key=lambda x: -x[1]) if v > 0.3][:3]
-    secondary = [m for m, v in sorted(muscle_activation.items(), key=lambda x: -x[1]) if 0.1 < v <= 0.3][:3]
+    primary, secondary = split_primary_secondary(muscle_activation)
     
     if workout_id:
         update_workout(workout_id, {
@@ -643,7 +650,11 @@ def process_workout_video(
         "video_id": video_id,
         "video_info": video_info,
         "exercises": exercises,
-        "workout_id": workout_id
+        "workout_id": workout_id,
+        "muscle_activation": muscle_activation,
+        "primary_muscles": primary,
+        "secondary_muscles": secondary,
+        "form_score": form_score
     }
 
 
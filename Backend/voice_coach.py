@@ -8,10 +8,10 @@ NOTE: This is for future voice features. Currently using text-based coach_servic
 import asyncio
 import json
 from typing import Optional, Callable
-from google import genai
 from google.genai import types
 
 from config import settings
+from gemini_service import get_client
 
 # ============================================================
 # Voice Coach Configuration
@@ -166,11 +166,15 @@ async def handle_get_muscle_balance(user_id: str, days: int = 30) -> dict:
 async def handle_get_form_issues(user_id: str, exercise: str = None, days: int = 30) -> dict:
     """Handler for get_form_issues function."""
     try:
-        from database import get_form_issues_summary
-        issues = get_form_issues_summary(user_id, days)
-        if exercise:
-            issues = [i for i in issues if exercise.lower() in i.get("exercise", "").lower()]
-        return {"count": len(issues), "issues": issues[:10]}
+        from database import get_form_issues_with_counts, SEVERE_FORM_SEVERITIES
+        # Totals and the ten newest issues come back from one aggregation
+        result = get_form_issues_with_counts(user_id, days, exercise, 10)
+        counts = result["counts"]
+        return {
+            "count": sum(n for severity, n in counts.items() if severity in SEVERE_FORM_SEVERITIES),
+            "counts": counts,
+            "issues": result["issues"]
+        }
     except Exception as e:
         return {"error": str(e), "count": 0, "issues": []}
 
@@ -282,7 +286,7 @@ class VoiceCoach:
         self.user_id = user_id
         self.function_handlers = function_handlers or DEFAULT_FUNCTION_HANDLERS
         self.voice = voice
-        self.client = genai.Client(api_key=settings.GOOGLE_API_KEY)
+        self.client = get_client()
         self.model = settings.GEMINI_MODEL
 
     def _get_config(self):